@@ -1,32 +1,17 @@
-from flask import Flask, jsonify, request, g
+from flask import Flask, Response, jsonify, request, g
 from flask_cors import CORS
-from flasgger import Swagger, swag_from
+import click
 import os
 from dotenv import load_dotenv
-import json
-import base64
-from firebase_admin import credentials, firestore
-import firebase_admin
-from werkzeug.exceptions import HTTPException, BadRequest, Forbidden
+from datetime import datetime, timezone
+from werkzeug.exceptions import HTTPException, BadRequest, Forbidden, NotFound
 from pydantic import ValidationError
 
 load_dotenv()
+# o firebase_admin e o client do Firestore sao criados no primeiro uso (services/firebase_client.py)
 
-sa_b64 = os.environ.get('FIREBASE_SERVICE_ACCOUNT_BASE64')
-if sa_b64:
-    try:
-        sa_json = json.loads(base64.b64decode(sa_b64).decode('utf-8'))
-        cred = credentials.Certificate(sa_json)
-    except Exception as e:
-        raise RuntimeError('Failed to parse FIREBASE_SERVICE_ACCOUNT_BASE64') from e
-else:
-    path = os.getenv('GOOGLE_APLICATION_CREDENTIALS') or os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-    if not path:
-        raise RuntimeError('Firebase service account not configured. Set FIREBASE_SERVICE_ACCOUNT_BASE64 or GOOGLE_APLICATION_CREDENTIALS')
-    cred = credentials.Certificate(path)
-
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+from services.metrics_service import init_metrics, instrument_firestore, register_stats
+instrument_firestore() # conta leituras/escritas do client compartilhado pelos services
 
 from models.users import UserRole
 
@@ -36,12 +21,26 @@ from services.auth_service import permission_required
 from services.users_service import *
 from services.books_service import *
 from services.sales_service import * 
-from services.google_books_service import fetch_book_by_isbn
+from services.google_books_service import fetch_book_by_isbn, isbn_cache_stats
+from services.book_cache import book_cache_stats
+from services.stock_service import stock_folder_stats
+from services.auth_service import token_verification_stats
+from services.pagination import parse_limit, parse_int_arg, parse_date_arg
+from services.search_index_service import search_books, rebuild_search_index
+from services.inventory_service import fetch_inventory_summary, rebuild_inventory_summary
+from services.version_service import conditional_get
+from services.response_utils import FastJSONProvider, init_compression
+from services.export_service import export_collection, EXPORT_FORMATS
+from services.api_docs import swag_from, init_api_docs, build_api_spec
 
 # Via auth vou ter o user_id, sebo_id e user_role
 
 app = Flask(__name__)
 
+if os.environ.get('FAST_JSON', '').lower() in ('1', 'true', 'yes'):
+    app.json = FastJSONProvider(app) # serializacao com orjson
+init_compression(app)
+
 allowed_origins = os.environ.get('CORS_ALLOWED_ORIGINS')
 if allowed_origins:
     origins = allowed_origins.split(',')
@@ -52,7 +51,8 @@ CORS(app, resources={
     r"/*": {
         "origins": origins,
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+        "expose_headers": ["ETag"],
         "supports_credentials": True,
         "max_age": 86400
     }
@@ -97,32 +97,17 @@ swagger_template = {
         {"name": "Livros", "description": "Endpoints de gerenciamento de inventário de livros"},
         {"name": "Usuários", "description": "Endpoints de gerenciamento de usuários"},
         {"name": "Vendas", "description": "Endpoints de gerenciamento de vendas"},
-        {"name": "Logs", "description": "Endpoints de logs de atividades"}
+        {"name": "Logs", "description": "Endpoints de logs de atividades"},
+        {"name": "Exportação", "description": "Exportação completa dos dados do sebo"}
     ]
 }
 
-swagger = Swagger(app, config=swagger_config, template=swagger_template)
-
-@app.before_request
-def _start_timer():
-    request._start_time = None
-    try:
-        import time
-        request._start_time = time.time()
-    except Exception:
-        request._start_time = None
-
-
-@app.after_request
-def _log_request_time(response):
-    try:
-        import time
-        if getattr(request, '_start_time', None):
-            duration = (time.time() - request._start_time) * 1000.0
-            app.logger.info(f"Request: {request.method} {request.path} completed in {duration:.1f}ms")
-    except Exception:
-        pass
-    return response
+init_metrics(app) # latencia por rota + operacoes do Firestore por requisicao, exposto em /metrics
+register_stats("isbn_cache", isbn_cache_stats)
+register_stats("book_cache", book_cache_stats)
+register_stats("auth_tokens", token_verification_stats)
+register_stats("audit_log", audit_log_stats)
+register_stats("stock_shards", stock_folder_stats)
 
 @app.errorhandler(ValidationError)
 def handle_validation_error(e: ValidationError):
@@ -173,6 +158,27 @@ def add_book_route():
     created = save_book(g.sebo_id, book_data, inventory_data)
     return jsonify(created), 201
 
+@app.route("/books/bulk", methods=["POST"])
+@permission_required(UserRole.ADMIN, UserRole.EDITOR)
+@log_action("Importar Livros em Lote")
+@swag_from('swagger_docs/books_bulk.yml')
+def bulk_add_books_route():
+    if "file" in request.files:
+        try:
+            content = request.files["file"].read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise BadRequest("Invalid bulk data: CSV file must be UTF-8 encoded")
+        rows = parse_bulk_csv(content)
+    elif request.mimetype == "text/csv":
+        rows = parse_bulk_csv(request.get_data(as_text=True))
+    else:
+        data = request.get_json(silent=True)
+        rows = data.get("books") if isinstance(data, dict) else data
+    if not rows:
+        raise BadRequest("Invalid bulk data: send a JSON list of rows or a CSV file")
+    report = bulk_save_books(g.sebo_id, rows)
+    return jsonify(report), 201 if report["created"] else 200
+
 @app.route("/books/manual", methods=["POST"])
 @permission_required(UserRole.ADMIN, UserRole.EDITOR)
 @log_action("Adicionar Livro Manualmente")
@@ -212,10 +218,41 @@ def add_manual_book_route():
 
 @app.route("/books", methods=["GET"])
 @permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
+@conditional_get("books")
 @swag_from('swagger_docs/books_list.yml')
 def list_books_route():
-    all_books = fetch_all_books(g.sebo_id)
-    return jsonify(all_books), 200
+    page_args = ('limit', 'startAfter', 'category', 'author', 'minQuantity', 'maxQuantity')
+    if not any(arg in request.args for arg in page_args): # sem parametros mantem a resposta antiga (lista completa)
+        all_books = fetch_all_books(g.sebo_id)
+        return jsonify(all_books), 200
+    page = fetch_books_page(
+        g.sebo_id,
+        limit=parse_limit(request.args.get('limit')),
+        start_after=request.args.get('startAfter'),
+        category=request.args.get('category'),
+        author=request.args.get('author'),
+        min_quantity=parse_int_arg(request.args, 'minQuantity'),
+        max_quantity=parse_int_arg(request.args, 'maxQuantity'),
+    )
+    return jsonify(page), 200
+
+@app.route("/books/search", methods=["GET"])
+@permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
+@swag_from('swagger_docs/books_search.yml')
+def search_books_route():
+    query = request.args.get("q", "").strip()
+    if not query:
+        raise BadRequest("Query parameter q is required")
+    results = search_books(g.sebo_id, query, limit=parse_limit(request.args.get('limit'), default=20, maximum=50))
+    return jsonify(results), 200
+
+@app.route("/books/summary", methods=["GET"])
+@permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
+@conditional_get("books") # o resumo muda junto com a versao dos livros
+@swag_from('swagger_docs/books_summary.yml')
+def inventory_summary_route():
+    summary = fetch_inventory_summary(g.sebo_id)
+    return jsonify(summary), 200
 
 @app.route("/books/<ISBN>", methods=["GET"])
 @permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
@@ -296,9 +333,9 @@ def get_user_route(user_id):
 @permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
 @swag_from('swagger_docs/users_delete.yml')
 def delete_user_route(user_id):
-    target = fetch_user(user_id)
-    if target.get('seboId') != g.sebo_id:
-        raise Forbidden("You can only delete users from your own sebo")
+    members = fetch_sebo_members(g.sebo_id, use_cache=False) # alvo e editor promovido checados numa leitura so
+    if user_id not in members:
+        raise NotFound(f"User with ID {user_id} not found in your sebo")
 
     is_self = (user_id == g.user_id)
     is_admin = (g.user_role == UserRole.ADMIN.value)
@@ -324,8 +361,8 @@ def delete_user_route(user_id):
         if promote_to == user_id:
             raise BadRequest("editorID cannot be the same as the deleting admin")
 
-        candidate = fetch_user(promote_to) # checa se o editor existe, pertence ao sebo e tem a role de editor
-        if candidate.get('seboId') != g.sebo_id:
+        candidate = members.get(promote_to) # checa se o editor existe, pertence ao sebo e tem a role de editor
+        if candidate is None:
             raise Forbidden("editorID must belong to your sebo")
         if candidate.get('userRole') != UserRole.EDITOR.value:
             raise BadRequest("editorID must currently have role Editor")
@@ -373,6 +410,7 @@ def update_user_route(user_id): # admin pode atualizar qualquer user do sebo, ed
 
 @app.route("/users", methods=["GET"])
 @permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
+@conditional_get("users")
 @swag_from('swagger_docs/users_list.yml')
 def fetch_all_users_route():
     users = fetch_all_sebo_users(g.sebo_id)
@@ -384,16 +422,47 @@ def fetch_all_users_route():
 
 @app.route("/sales", methods=["GET"])
 @permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
+@conditional_get("sales")
 @swag_from('swagger_docs/sales_list.yml')
 def fetch_all_sales_route():
-    sales = fetch_all_sales(g.sebo_id)
-    return jsonify(sales), 200
+    page_args = ('limit', 'startAfter', 'from', 'to', 'seller', 'category')
+    if not any(arg in request.args for arg in page_args): # sem parametros mantem a resposta antiga (lista completa)
+        sales = fetch_all_sales(g.sebo_id)
+        return jsonify(sales), 200
+    page = fetch_sales_page(
+        g.sebo_id,
+        limit=parse_limit(request.args.get('limit')),
+        start_after=request.args.get('startAfter'),
+        date_from=parse_date_arg(request.args, 'from'),
+        date_to=parse_date_arg(request.args, 'to', end_of_day=True),
+        seller_id=request.args.get('seller'),
+        category=request.args.get('category'),
+    )
+    return jsonify(page), 200
+
+@app.route("/sales/stats", methods=["GET"])
+@permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
+@swag_from('swagger_docs/sales_stats.yml')
+def fetch_sales_stats_route():
+    stats = fetch_sales_stats(g.sebo_id)
+    return jsonify(stats), 200
+
+@app.route("/sales/batch", methods=["POST"])
+@permission_required(UserRole.ADMIN, UserRole.EDITOR)
+@swag_from('swagger_docs/sales_create_batch.yml')
+def create_sale_batch_route():
+    data = request.get_json()
+    if not data:
+        raise BadRequest("Invalid JSON data")
+    items = data.get("items") if isinstance(data, dict) else data
+    receipt = create_sale_batch(g.user_id, g.sebo_id, items, g.name)
+    return jsonify(receipt), 201
 
 @app.route("/sales/<ISBN>/<copy_id>", methods=["POST"])
 @permission_required(UserRole.ADMIN, UserRole.EDITOR)
 @swag_from('swagger_docs/sales_create.yml')
 def create_sale_route(ISBN, copy_id):
-    sale_data = create_sale(g.user_id, g.sebo_id, ISBN, copy_id)
+    sale_data = create_sale(g.user_id, g.sebo_id, ISBN, copy_id, g.name)
     return jsonify(sale_data), 201
 
 @app.route("/sales/<sale_id>", methods=["GET"])
@@ -446,11 +515,105 @@ def update_log_route(log_id):
 
 @app.route("/logs", methods=["GET"])
 @permission_required(UserRole.ADMIN, UserRole.EDITOR, UserRole.READER)
+@conditional_get("logs")
 @swag_from('swagger_docs/logs_list.yml')
 def fetch_all_logs_route():
-    logs = fetch_all_logs(g.sebo_id)
+    page_args = ('limit', 'startAfter', 'userId', 'action', 'from', 'to')
+    if not any(arg in request.args for arg in page_args): # sem parametros mantem a resposta antiga (lista completa)
+        logs = fetch_all_logs(g.sebo_id)
+        return jsonify(logs), 200
+    page = fetch_logs_page(
+        g.sebo_id,
+        limit=parse_limit(request.args.get('limit')),
+        start_after=request.args.get('startAfter'),
+        user_id=request.args.get('userId'),
+        action=request.args.get('action'),
+        date_from=parse_date_arg(request.args, 'from'),
+        date_to=parse_date_arg(request.args, 'to', end_of_day=True),
+    )
+    return jsonify(page), 200
+
+@app.route("/logs/archive", methods=["POST"])
+@permission_required(UserRole.ADMIN)
+@swag_from('swagger_docs/logs_archive.yml')
+def archive_logs_route():
+    data = request.get_json(silent=True) or {}
+    older_than_days = data.get("olderThanDays", LOG_RETENTION_DAYS)
+    if not isinstance(older_than_days, int):
+        raise BadRequest("olderThanDays must be an integer")
+    result = archive_old_logs(g.sebo_id, older_than_days, cutoff=data.get("cutoff"))
+    return jsonify(result), 200
+
+@app.route("/logs/archives", methods=["GET"])
+@permission_required(UserRole.ADMIN)
+@swag_from('swagger_docs/logs_archives_list.yml')
+def list_log_archives_route():
+    archives = fetch_log_archives(g.sebo_id)
+    return jsonify(archives), 200
+
+@app.route("/logs/archives/<month>", methods=["GET"])
+@permission_required(UserRole.ADMIN)
+@swag_from('swagger_docs/logs_archives_get.yml')
+def get_log_archive_route(month):
+    logs = fetch_archived_logs(g.sebo_id, month)
     return jsonify(logs), 200
 
+# ============================================
+#                   Exportação
+# ============================================
+
+@app.route("/export/<any(books, sales, logs):kind>", methods=["GET"])
+@permission_required(UserRole.ADMIN)
+@log_action("Exportar Dados")
+@swag_from('swagger_docs/export.yml')
+def export_route(kind): # streaming: memoria constante, os primeiros bytes saem antes de ler a colecao toda
+    export_format = request.args.get("format", "ndjson").lower()
+    if export_format not in EXPORT_FORMATS:
+        raise BadRequest("format must be ndjson or csv")
+    filename = f"{kind}-{datetime.now(timezone.utc):%Y%m%d}.{export_format}"
+    return Response(
+        export_collection(g.sebo_id, kind, export_format),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+init_api_docs(app, swagger_config, swagger_template) # depois das rotas: a spec pre-compilada depende delas
+
+@app.cli.command("build-spec")
+def build_spec_command(): # flask --app app build-spec, depois de mudar rotas ou swagger_docs/
+    print(f"OpenAPI spec written to {build_api_spec(app, swagger_config, swagger_template)}")
+
+@app.cli.command("archive-logs")
+@click.option("--sebo-id", help="So este sebo; sem a opcao, todos.")
+@click.option("--days", type=int, default=LOG_RETENTION_DAYS, show_default=True, help="Idade minima dos logs arquivados.")
+def archive_logs_command(sebo_id, days): # flask --app app archive-logs, agendado (cron) para a retencao dos logs
+    for current_id in [sebo_id] if sebo_id else list_sebo_ids():
+        result = {"cutoff": None, "hasMore": True}
+        archived = 0
+        while result["hasMore"]: # cada chamada e limitada por ARCHIVE_MAX_LOGS
+            result = archive_old_logs(current_id, days, cutoff=result["cutoff"])
+            archived += result["archivedLogs"]
+        print(f"{current_id}: {archived} logs archived (before {result['cutoff']})")
+
+
+@app.cli.command("rebuild-stats")
+@click.option("--sebo-id", help="So este sebo; sem a opcao, todos.")
+def rebuild_stats_command(sebo_id): # flask --app app rebuild-stats, uma vez para dados anteriores aos contadores
+    for current_id in [sebo_id] if sebo_id else list_sebo_ids():
+        summary = rebuild_inventory_summary(current_id)
+        stats = rebuild_sales_stats(current_id)
+        print(f"{current_id}: {summary['totalCopies']} copies, {stats['totalUnits']} sales")
+
+
+@app.cli.command("rebuild-search-index")
+@click.option("--sebo-id", help="So este sebo; sem a opcao, todos.")
+def rebuild_search_index_command(sebo_id): # flask --app app rebuild-search-index, para livros anteriores ao indice
+    for current_id in [sebo_id] if sebo_id else list_sebo_ids():
+        print(f"{current_id}: {rebuild_search_index(current_id)} books indexed")
 
 
 if __name__ == '__main__':
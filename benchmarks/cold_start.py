@@ -0,0 +1,128 @@
+"""Mede o cold start do app: import, primeiro acesso ao Firestore e primeira /apispec.json.
+
+Cada execução é um processo novo (`python -X importtime`), como um worker do gunicorn
+subindo, com a mesma service account falsa do benchmarks.loadtest. Relata a mediana de:
+
+- import:    `import app` (módulos, rotas, docs)
+- firebase:  primeiro get_db() (decodifica a credencial e cria o client; não acessa a rede)
+- apispec:   primeira GET /apispec.json
+- apidocs:   primeira GET /apidocs/ (404 com API_DOCS=0)
+
+para cada valor de API_DOCS, e os pacotes que mais pesam no import.
+
+    python -m benchmarks.cold_start --runs 7 --output benchmarks/cold_start.json
+    python -m benchmarks.cold_start --compare benchmarks/cold_start.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.loadtest import PROJECT, _fake_service_account
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ("import", "firebase", "apispec", "apidocs")
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import app
+timings = {"import": time.perf_counter() - started}
+client = app.app.test_client()
+for phase, url in (("apispec", "/apispec.json"), ("apidocs", "/apidocs/")):
+    started = time.perf_counter()
+    client.get(url)
+    timings[phase] = time.perf_counter() - started
+from services.firebase_client import get_db
+started = time.perf_counter()
+get_db()
+timings["firebase"] = time.perf_counter() - started
+print(json.dumps(timings))
+"""
+
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package"; por pacote raiz fica o maior
+    # cumulativo, que e o do import mais externo dele
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        root = name.strip().split(".")[0]
+        packages[root] = max(packages.get(root, 0), int(cumulative) / 1e6)
+    return packages
+
+
+def run_once(api_docs):
+    env = dict(os.environ, API_DOCS=api_docs, GOOGLE_CLOUD_PROJECT=PROJECT,
+               FIREBASE_SERVICE_ACCOUNT_BASE64=_fake_service_account(PROJECT))
+    env.pop("GOOGLE_APPLICATION_CREDENTIALS", None)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD], cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def measure(api_docs, runs, top):
+    timings = {phase: [] for phase in PHASES}
+    packages = {}
+    for _ in range(runs):
+        sample, imported = run_once(api_docs)
+        for phase in PHASES:
+            timings[phase].append(sample[phase])
+        for name, seconds in imported.items():
+            packages.setdefault(name, []).append(seconds)
+    medians = {name: statistics.median(values) for name, values in packages.items() if name != "app"}
+    heaviest = sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "phases": {phase: statistics.median(values) for phase, values in timings.items()},
+        "packages": dict(heaviest),
+    }
+
+
+def print_report(report, baseline=None):
+    for api_docs, result in report["modes"].items():
+        print(f"API_DOCS={api_docs}")
+        print(f"  {'fase':<10}  {'ms':>9}  {'vs base':>8}")
+        for phase, seconds in result["phases"].items():
+            delta = ""
+            reference = (baseline or {}).get("modes", {}).get(api_docs, {}).get("phases", {}).get(phase)
+            if reference:
+                delta = f"{(seconds - reference) / reference:+.0%}"
+            print(f"  {phase:<10}  {seconds * 1000:>9.1f}  {delta:>8}")
+        print(f"  {'pacote':<24}  {'ms (cumulativo)':>15}")
+        for name, seconds in result["packages"].items():
+            print(f"  {name:<24}  {seconds * 1000:>15.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="processos por modo; o resultado é a mediana")
+    parser.add_argument("--modes", default="1,0", help="valores de API_DOCS, separados por vírgula")
+    parser.add_argument("--top", type=int, default=12, help="pacotes mais pesados listados")
+    parser.add_argument("--output", help="grava o relatório em JSON (ex.: benchmarks/cold_start.json)")
+    parser.add_argument("--compare", help="relatório JSON anterior para mostrar a variação de cada fase")
+    args = parser.parse_args()
+
+    report = {
+        "config": {"runs": args.runs},
+        "modes": {api_docs: measure(api_docs, args.runs, args.top) for api_docs in args.modes.split(",")},
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+            output_file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Conta leituras e round trips do Firestore por operação de books_service.
+
+Roda contra o emulador do Firestore (nunca contra produção):
+
+    firebase emulators:start --only firestore
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.firestore_reads --copies 20
+
+Leituras seguem a regra de cobrança do Firestore: um documento lido = uma
+leitura, e toda query custa pelo menos uma leitura mesmo sem resultados.
+"""
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+
+import firebase_admin
+from firebase_admin import credentials
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.firestore_v1 import batch as batch_module
+from google.cloud.firestore_v1 import client as client_module
+from google.cloud.firestore_v1 import document as document_module
+from google.cloud.firestore_v1 import query as query_module
+from google.cloud.firestore_v1 import transaction as transaction_module
+
+
+class _EmulatorCredential(credentials.Base):
+    def get_credential(self):
+        return AnonymousCredentials()
+
+
+class OperationCounter:
+    def __init__(self):
+        self.reads = 0
+        self.round_trips = 0
+        self.commits = 0
+
+    def reset(self):
+        self.reads = self.round_trips = self.commits = 0
+
+
+counter = OperationCounter()
+
+
+def _count_documents(iterator, minimum):
+    counter.round_trips += 1
+    seen = 0
+    for item in iterator:
+        seen += 1
+        yield item
+    counter.reads += max(seen, minimum)
+
+
+def install_counters():
+    original_get_all = client_module.Client.get_all
+    original_document_get = document_module.DocumentReference.get
+    original_stream = query_module.Query.stream
+    original_batch_commit = batch_module.WriteBatch.commit
+    original_tx_commit = transaction_module.Transaction._commit
+
+    def get_all(self, *args, **kwargs):
+        return _count_documents(original_get_all(self, *args, **kwargs), minimum=0)
+
+    def document_get(self, *args, **kwargs):
+        # DocumentReference.get chama batch_get_documents direto, sem passar pelo get_all
+        counter.round_trips += 1
+        counter.reads += 1
+        return original_document_get(self, *args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return _count_documents(original_stream(self, *args, **kwargs), minimum=1)
+
+    def batch_commit(self, *args, **kwargs):
+        counter.round_trips += 1
+        counter.commits += 1
+        return original_batch_commit(self, *args, **kwargs)
+
+    def tx_commit(self, *args, **kwargs):
+        counter.round_trips += 1
+        counter.commits += 1
+        return original_tx_commit(self, *args, **kwargs)
+
+    client_module.Client.get_all = get_all
+    document_module.DocumentReference.get = document_get
+    query_module.Query.stream = stream
+    batch_module.WriteBatch.commit = batch_commit
+    transaction_module.Transaction._commit = tx_commit
+
+
+@contextmanager
+def measure(results, name):
+    counter.reset()
+    yield
+    results.append((name, counter.reads, counter.round_trips, counter.commits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=20, help="cópias do livro usado nas medições")
+    parser.add_argument("--project", default="volta-estante-bench")
+    args = parser.parse_args()
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("FIRESTORE_EMULATOR_HOST is not set; refusing to run against a real project")
+
+    firebase_admin.initialize_app(_EmulatorCredential(), {"projectId": args.project})
+    install_counters()
+
+    from services import books_service
+
+    sebo_id = "bench-sebo"
+    ISBN = "9780134685991"
+    book_data = {"ISBN": ISBN, "title": "Effective Java", "authors": ["Joshua Bloch"], "categories": ["Programming"]}
+    books_service.db.collection("Sebos").document(sebo_id).set({"seboId": sebo_id, "nameSebo": "Bench"})
+
+    results = []
+    with measure(results, "add_manual_book (novo livro)"):
+        books_service.add_manual_book(sebo_id, dict(book_data), {"price": 10.0, "conservation_state": "Bom"})
+    with measure(results, "save_book (livro existente)"):
+        books_service.save_book(sebo_id, dict(book_data), {"price": 12.0})
+    for _ in range(max(args.copies - 2, 0)):
+        books_service.save_book(sebo_id, dict(book_data), {"price": 15.0})
+
+    with measure(results, f"fetch_book ({args.copies} cópias)"):
+        book = books_service.fetch_book(sebo_id, ISBN)
+    copy_ids = [copy["copyId"] for copy in book["copies"]]
+    with measure(results, f"update_book ({args.copies} cópias)"):
+        books_service.update_book(sebo_id, ISBN, copy_ids[0], {"price": 20.0})
+    with measure(results, "delete_copy"):
+        books_service.delete_copy(sebo_id, ISBN, copy_ids[1])
+    with measure(results, f"delete_book ({args.copies - 1} cópias)"):
+        books_service.delete_book(sebo_id, ISBN)
+
+    width = max(len(name) for name, *_ in results)
+    print(f"{'operação'.ljust(width)}  leituras  round trips  commits")
+    for name, reads, round_trips, commits in results:
+        print(f"{name.ljust(width)}  {reads:>8}  {round_trips:>11}  {commits:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,677 @@
+"""Teste de carga reprodutível de todas as rotas do app.py contra o emulador do Firestore.
+
+Sobe (ou reaproveita) o emulador, apaga os dados do projeto de benchmark, popula
+sebos com livros, cópias, vendas e logs, troca `auth.verify_id_token` e as
+chamadas de administração de usuários do firebase_admin por stubs e aponta a
+Google Books API para um servidor HTTP local. Depois dispara as requisições em
+paralelo contra o app servido por um servidor WSGI com threads no mesmo processo
+e relata vazão, latência (p50/p95/p99) e operações do Firestore por requisição,
+lidas dos contadores de services/metrics_service.py.
+
+    # inicia o emulador sozinho (precisa do firebase CLI e de Java no PATH)
+    python -m benchmarks.loadtest --output benchmarks/baseline.json
+
+    # ou reaproveita um emulador já rodando
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.loadtest --compare benchmarks/baseline.json
+
+A sequência de requisições sai de um gerador com semente fixa (`--seed`), então
+duas execuções com os mesmos parâmetros fazem exatamente as mesmas chamadas.
+
+Sai com código 1 se a fração de respostas 5xx passar de `--max-server-error-rate`
+(padrão 0) ou a de 4xx/5xx passar de `--max-error-rate` (padrão 1%). O workflow
+`.github/workflows/loadtest.yml` roda o teste no CI a cada push na main e publica o
+relatório medido como artefato `loadtest-results`.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+
+PROJECT = "volta-estante-loadtest"
+METRICS_TOKEN = "loadtest-metrics" # o /metrics fica fechado sem token
+CATEGORIES = ["Ficção", "Romance", "História", "Fantasia", "Biografia", "Tecnologia", "Poesia", "Infantil"]
+WORDS = ["estante", "memorias", "cidade", "noite", "jardim", "viagem", "segredo", "tempo", "mar", "casa"]
+STATES = ["Novo", "Bom", "Mediano", "Péssimo"]
+IGNORED_BLUEPRINTS = ("flasgger.",) # UI e spec do Swagger ficam fora da carga
+
+
+# ------------------------------------------------------------------
+# ambiente: emulador, credencial falsa, stubs de auth e Google Books
+# ------------------------------------------------------------------
+
+def _wait_for_port(host_port, timeout):
+    host, port = host_port.rsplit(":", 1)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, int(port)), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def start_emulator(args):
+    """Devolve o processo do emulador iniciado aqui, ou None se FIRESTORE_EMULATOR_HOST ja existir."""
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        return None
+    command = args.emulator_cmd.format(project=args.project, host=args.emulator_host)
+    process = subprocess.Popen(shlex.split(command), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not _wait_for_port(args.emulator_host, timeout=90):
+        process.terminate()
+        sys.exit(f"Firestore emulator did not start with: {command}")
+    os.environ["FIRESTORE_EMULATOR_HOST"] = args.emulator_host
+    return process
+
+
+def reset_emulator(project):
+    host = os.environ["FIRESTORE_EMULATOR_HOST"]
+    requests.delete(f"http://{host}/emulator/v1/projects/{project}/databases/(default)/documents", timeout=30)
+
+
+def _fake_service_account(project):
+    # o firebase_admin so aceita um service account com chave RSA valida; com o emulador ela nunca e usada
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode("ascii")
+    account = {
+        "type": "service_account",
+        "project_id": project,
+        "private_key_id": "loadtest",
+        "private_key": pem,
+        "client_email": f"loadtest@{project}.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+    return base64.b64encode(json.dumps(account).encode("utf-8")).decode("ascii")
+
+
+class _GoogleBooksStub(BaseHTTPRequestHandler):
+    """Responde `q=isbn:<ISBN>` com um volume deterministico derivado do ISBN."""
+
+    latency = 0.0
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        ISBN = query.removeprefix("isbn:")
+        rng = random.Random(ISBN)
+        volume = {"volumeInfo": {
+            "title": " ".join(rng.sample(WORDS, 3)).title(),
+            "authors": [f"Autor {rng.randint(1, 500)}"],
+            "publisher": f"Editora {rng.randint(1, 50)}",
+            "categories": rng.sample(CATEGORIES, 2),
+            "publishedDate": str(rng.randint(1950, 2024)),
+            "description": "Volume gerado pelo stub da Google Books API.",
+            "pageCount": rng.randint(80, 900),
+            "language": "pt-BR",
+            "industryIdentifiers": [{"type": "ISBN_13", "identifier": ISBN}],
+        }}
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps({"totalItems": 1, "items": [volume]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_google_books_stub(latency):
+    _GoogleBooksStub.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _GoogleBooksStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/books/v1/volumes"
+
+
+def make_token(user_id, sebo_id=None, role=None, name="Bench User"):
+    claims = {"uid": user_id, "email": f"{user_id}@loadtest.local", "name": name}
+    if sebo_id:
+        claims.update(seboId=sebo_id, userRole=role)
+    return base64.urlsafe_b64encode(json.dumps(claims).encode("utf-8")).decode("ascii")
+
+
+def install_auth_stubs():
+    from firebase_admin import auth
+    counter = iter(range(10 ** 9))
+
+    def verify_id_token(token, *args, **kwargs):
+        claims = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        claims["exp"] = time.time() + 3600
+        return claims
+
+    auth.verify_id_token = verify_id_token
+    auth.set_custom_user_claims = lambda *args, **kwargs: None
+    auth.delete_user = lambda *args, **kwargs: None
+    auth.create_user = lambda **kwargs: SimpleNamespace(uid=f"employee-{next(counter)}")
+    auth.generate_password_reset_link = lambda email, *args, **kwargs: f"https://loadtest.local/reset?email={email}"
+
+
+def create_app():
+    """Entrada para o gunicorn (`benchmarks.loadtest:create_app()`): o app com os stubs de auth."""
+    install_auth_stubs()
+    from app import app
+    return app
+
+
+def prepare_environment(args):
+    os.environ["FIREBASE_SERVICE_ACCOUNT_BASE64"] = _fake_service_account(args.project)
+    os.environ["GOOGLE_CLOUD_PROJECT"] = args.project
+    os.environ["GOOGLE_BOOKS_BASE_URL"] = start_google_books_stub(args.google_latency)
+    os.environ["METRICS_TOKEN"] = METRICS_TOKEN
+    if args.fast_json:
+        os.environ["FAST_JSON"] = "1"
+
+
+# ------------------------------------------------------------------
+# massa de dados
+# ------------------------------------------------------------------
+
+class SeboState:
+    """Ids criados no seed e consumidos pelos cenarios; cada pool e usado por um cenario so."""
+
+    def __init__(self, sebo_id):
+        self.sebo_id = sebo_id
+        self.admin = f"{sebo_id}-admin"
+        self.editor = f"{sebo_id}-editor"
+        self.reader = f"{sebo_id}-reader"
+        self.books = [] # ISBNs estaveis (nunca deletados)
+        self.stable_copies = [] # (ISBN, copyId) so atualizadas
+        self.sellable_copies = deque() # (ISBN, copyId) vendidas ou deletadas
+        self.doomed_books = deque()
+        self.disposable_users = deque()
+        self.sales = []
+        self.doomed_sales = deque()
+        self.logs = []
+        self.archive_months = []
+        self.lock = threading.Lock()
+        self.next_isbn = 0
+
+    def pop(self, pool):
+        with self.lock:
+            return pool.popleft() if pool else None
+
+    def new_isbn(self, sebo_index):
+        with self.lock:
+            self.next_isbn += 1
+            return f"979{sebo_index:02d}{self.next_isbn:08d}"
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def seed(args, rng):
+    from models.alteration_log import AlterationLog
+    from models.sales import Sales
+    from models.sebos import Sebo
+    from models.users import User
+    from services.alteration_log_service import archive_old_logs, fetch_log_archives
+    from services.books_service import bulk_save_books, BULK_MAX_ROWS
+    from services.sales_service import rebuild_sales_stats
+
+    from services.firebase_client import get_db
+
+    db = get_db()
+    states = []
+    now = datetime.now(timezone.utc)
+    for sebo_index in range(args.sebos):
+        sebo_id = f"loadtest-sebo-{sebo_index}"
+        state = SeboState(sebo_id)
+        batch = db.batch()
+        sebo = Sebo(sebo_id=sebo_id, user_id=state.admin, name_sebo=f"Sebo {sebo_index}")
+        batch.set(db.collection("Sebos").document(sebo_id), sebo.model_dump(by_alias=True))
+        users = [(state.admin, "Admin"), (state.editor, "Editor"), (state.reader, "Reader")]
+        users += [(f"{sebo_id}-temp-{index}", "Reader") for index in range(args.disposable_users)]
+        for user_id, role in users:
+            user = User(user_id=user_id, name=f"Usuário {user_id}", email=f"{user_id}@loadtest.local",
+                        name_sebo=sebo.name_sebo, sebo_id=sebo_id, user_role=role)
+            batch.set(db.collection("Users").document(user_id), user.model_dump(by_alias=True))
+        batch.commit()
+        state.disposable_users.extend(user_id for user_id, _ in users[3:])
+
+        # livros e copias passam pelo bulk_save_books, mantendo indices e contadores como em producao
+        doomed = max(args.books // 20, 1)
+        rows, isbns = [], []
+        for book_index in range(args.books + doomed):
+            ISBN = f"978{sebo_index:02d}{book_index:08d}"
+            isbns.append(ISBN)
+            for _ in range(args.copies):
+                rows.append({"ISBN": ISBN, "price": round(rng.uniform(5, 120), 2),
+                             "conservationState": rng.choice(STATES)})
+        copies_by_isbn = defaultdict(list)
+        for chunk in _chunks(rows, BULK_MAX_ROWS):
+            report = bulk_save_books(sebo_id, chunk)
+            for result in report["results"]:
+                if result["status"] == "created":
+                    copies_by_isbn[result["ISBN"]].append(result["copyId"])
+        for ISBN in isbns[:args.books]:
+            copies = copies_by_isbn.get(ISBN, [])
+            if not copies:
+                continue
+            state.books.append(ISBN)
+            state.stable_copies.append((ISBN, copies[0]))
+            state.sellable_copies.extend((ISBN, copy_id) for copy_id in copies[1:])
+        state.doomed_books.extend(isbns[args.books:])
+
+        sales_coll = db.collection("Sales").document(sebo_id).collection("saleId")
+        for chunk in _chunks(range(args.sales), 500):
+            batch = db.batch()
+            for _ in chunk:
+                ISBN = rng.choice(isbns)
+                sale = Sales.model_validate({
+                    "userId": state.editor, "userName": f"Usuário {state.editor}", "ISBN": ISBN,
+                    "bookTitle": f"Livro {ISBN}", "authors": [f"Autor {rng.randint(1, 500)}"],
+                    "bookCategory": rng.sample(CATEGORIES, 1), "bookPrice": round(rng.uniform(5, 120), 2),
+                    "conservationState": rng.choice(STATES),
+                    "saleDate": (now - timedelta(minutes=rng.randint(0, 90 * 24 * 60))).isoformat(),
+                })
+                batch.set(sales_coll.document(sale.sale_id), sale.model_dump(by_alias=True))
+                state.sales.append(sale.sale_id)
+            batch.commit()
+        rebuild_sales_stats(sebo_id) # vendas gravadas direto, como as anteriores aos contadores
+        doomed_sales = max(args.sales // 20, 1)
+        state.doomed_sales.extend(state.sales[:doomed_sales])
+        state.sales = state.sales[doomed_sales:]
+
+        logs_coll = db.collection("Sebos").document(sebo_id).collection("AlterationLogs")
+        for chunk in _chunks(range(args.logs), 500):
+            batch = db.batch()
+            for _ in chunk:
+                log = AlterationLog.model_validate({
+                    "userId": state.editor, "userName": f"Usuário {state.editor}",
+                    "action": rng.choice(["Adicionar ao Estoque", "Atualizar Livro", "Pesquisar Livro"]),
+                    "details": {"ISBN": rng.choice(isbns)},
+                    "timestamp": (now - timedelta(minutes=rng.randint(0, 180 * 24 * 60))).isoformat(),
+                })
+                batch.set(logs_coll.document(log.log_id), log.model_dump(by_alias=True))
+                state.logs.append(log.log_id)
+            batch.commit()
+        # metade mais antiga vai para o arquivo, para as rotas de arquivo terem o que ler
+        result = archive_old_logs(sebo_id, 90)
+        while result["hasMore"]:
+            result = archive_old_logs(sebo_id, cutoff=result["cutoff"])
+        state.archive_months = [archive["month"] for archive in fetch_log_archives(sebo_id)]
+        remaining = {log_doc.id for log_doc in logs_coll.select([]).stream()}
+        state.logs = [log_id for log_id in state.logs if log_id in remaining]
+        states.append(state)
+    return states
+
+
+# ------------------------------------------------------------------
+# cenarios: (metodo, regra do Flask, peso, funcao que monta a chamada)
+# cada funcao recebe (state, sebo_index, rng) e devolve (token, path, kwargs) ou None
+# ------------------------------------------------------------------
+
+def _admin(state):
+    return make_token(state.admin, state.sebo_id, "Admin", "Admin Bench")
+
+
+def _editor(state):
+    return make_token(state.editor, state.sebo_id, "Editor", "Editor Bench")
+
+
+def _reader(state):
+    return make_token(state.reader, state.sebo_id, "Reader", "Reader Bench")
+
+
+def _sell(state, count):
+    items = [state.pop(state.sellable_copies) for _ in range(count)]
+    return [item for item in items if item]
+
+
+def _post_sale(state, index, rng):
+    items = _sell(state, 1)
+    if not items:
+        return None
+    ISBN, copy_id = items[0]
+    return _editor(state), f"/sales/{ISBN}/{copy_id}", {}
+
+
+def _post_sale_batch(state, index, rng):
+    items = _sell(state, 3)
+    if not items:
+        return None
+    return _editor(state), "/sales/batch", {"json": {"items": [{"ISBN": ISBN, "copyId": copy_id} for ISBN, copy_id in items]}}
+
+
+def _delete_copy(state, index, rng):
+    items = _sell(state, 1)
+    if not items:
+        return None
+    ISBN, copy_id = items[0]
+    return _editor(state), f"/books/{ISBN}/copies/{copy_id}", {}
+
+
+def _delete_book(state, index, rng):
+    ISBN = state.pop(state.doomed_books)
+    return (_admin(state), f"/books/{ISBN}", {}) if ISBN else None
+
+
+def _delete_sale(state, index, rng):
+    sale_id = state.pop(state.doomed_sales)
+    return (_admin(state), f"/sales/{sale_id}", {}) if sale_id else None
+
+
+def _delete_user(state, index, rng):
+    user_id = state.pop(state.disposable_users)
+    return (_admin(state), f"/users/{user_id}", {}) if user_id else None
+
+
+def _create_user(state, index, rng):
+    user_id = f"{state.sebo_id}-signup-{state.new_isbn(index)}"
+    return make_token(user_id), "/users", {"json": {"nameSebo": f"Novo sebo {user_id}", "userRole": "Admin"}}
+
+
+SCENARIOS = [
+    ("GET", "/books", 10, lambda s, i, r: (_reader(s), "/books", {})),
+    ("GET", "/books", 6, lambda s, i, r: (_reader(s), f"/books?limit=50&category={r.choice(CATEGORIES)}", {})),
+    ("GET", "/books/search", 8, lambda s, i, r: (_reader(s), f"/books/search?q={r.choice(WORDS)}", {})),
+    ("GET", "/books/summary", 3, lambda s, i, r: (_reader(s), "/books/summary", {})),
+    ("GET", "/books/<ISBN>", 12, lambda s, i, r: (_reader(s), f"/books/{r.choice(s.books)}", {})),
+    ("POST", "/books", 3, lambda s, i, r: (_editor(s), "/books", {"json": {"ISBN": s.new_isbn(i), "price": 25.0}})),
+    ("POST", "/books/manual", 2, lambda s, i, r: (_editor(s), "/books/manual", {"json": {
+        "ISBN": s.new_isbn(i), "title": f"Manual {r.choice(WORDS)}", "conservationState": "Bom", "price": 30.0}})),
+    ("POST", "/books/bulk", 1, lambda s, i, r: (_editor(s), "/books/bulk", {"json": [
+        {"ISBN": s.new_isbn(i), "price": 10.0} for _ in range(10)]})),
+    ("PUT", "/books/<ISBN>/copies/<copy_id>", 3, lambda s, i, r: (lambda ISBN, copy_id: (
+        _editor(s), f"/books/{ISBN}/copies/{copy_id}", {"json": {"price": round(r.uniform(5, 120), 2)}}))(
+        *r.choice(s.stable_copies))),
+    ("DELETE", "/books/<ISBN>/copies/<copy_id>", 1, _delete_copy),
+    ("DELETE", "/books/<ISBN>", 1, _delete_book),
+    ("POST", "/users", 1, _create_user),
+    ("GET", "/users", 3, lambda s, i, r: (_reader(s), "/users", {})),
+    ("GET", "/users/<user_id>", 3, lambda s, i, r: (_reader(s), f"/users/{s.reader}", {})),
+    ("PUT", "/users/<user_id>", 1, lambda s, i, r: (_admin(s), f"/users/{s.editor}", {"json": {"name": f"Editor {r.randint(1, 99)}"}})),
+    ("DELETE", "/users/<user_id>", 1, _delete_user),
+    ("POST", "/users/employees/", 1, lambda s, i, r: (_admin(s), "/users/employees/", {"json": {
+        "email": f"func-{s.new_isbn(i)}@loadtest.local", "name": "Funcionário", "userRole": "Reader"}})),
+    ("GET", "/sales", 6, lambda s, i, r: (_reader(s), "/sales", {})),
+    ("GET", "/sales", 4, lambda s, i, r: (_reader(s), "/sales?limit=50", {})),
+    ("GET", "/sales/stats", 4, lambda s, i, r: (_reader(s), "/sales/stats", {})),
+    ("GET", "/sales/<sale_id>", 4, lambda s, i, r: (_reader(s), f"/sales/{r.choice(s.sales)}", {})),
+    ("POST", "/sales/<ISBN>/<copy_id>", 4, _post_sale),
+    ("POST", "/sales/batch", 2, _post_sale_batch),
+    ("PUT", "/sales/<sale_id>", 1, lambda s, i, r: (_editor(s), f"/sales/{r.choice(s.sales)}", {"json": {"book_price": 20.0}})),
+    ("DELETE", "/sales/<sale_id>", 1, _delete_sale),
+    ("GET", "/logs", 4, lambda s, i, r: (_reader(s), "/logs", {})),
+    ("GET", "/logs", 3, lambda s, i, r: (_reader(s), "/logs?limit=50", {})),
+    ("GET", "/logs/<log_id>", 2, lambda s, i, r: (_reader(s), f"/logs/{r.choice(s.logs)}", {})),
+    ("PUT", "/logs/<log_id>", 1, lambda s, i, r: (_admin(s), f"/logs/{r.choice(s.logs)}", {"json": {"action": "Revisado"}})),
+    ("POST", "/logs/archive", 1, lambda s, i, r: (_admin(s), "/logs/archive", {"json": {"olderThanDays": 90}})),
+    ("GET", "/logs/archives", 1, lambda s, i, r: (_admin(s), "/logs/archives", {})),
+    ("GET", "/logs/archives/<month>", 1, lambda s, i, r: (_admin(s), f"/logs/archives/{r.choice(s.archive_months)}", {})),
+    ("GET", "/export/<any(books, sales, logs):kind>", 1, lambda s, i, r: (
+        _admin(s), f"/export/{r.choice(['books', 'sales', 'logs'])}?format={r.choice(['ndjson', 'csv'])}", {})),
+    ("GET", "/metrics", 1, lambda s, i, r: (METRICS_TOKEN, "/metrics", {})),
+]
+
+
+def plan_requests(states, total, rng):
+    weights = [weight for _, _, weight, _ in SCENARIOS]
+    plan = []
+    for _ in range(total):
+        sebo_index = rng.randrange(len(states))
+        plan.append((rng.choices(range(len(SCENARIOS)), weights)[0], sebo_index, rng.random()))
+    return plan
+
+
+def check_coverage(app):
+    exercised = {(method, rule) for method, rule, _, _ in SCENARIOS}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint in ("static", "apispec") or rule.endpoint.startswith(IGNORED_BLUEPRINTS):
+            continue
+        for method in rule.methods - {"HEAD", "OPTIONS"}:
+            if (method, rule.rule) not in exercised:
+                missing.append(f"{method} {rule.rule}")
+    return sorted(missing)
+
+
+# ------------------------------------------------------------------
+# execucao e relatorio
+# ------------------------------------------------------------------
+
+def start_app_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1" # keep-alive entre as requisicoes do mesmo cliente
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(int(q * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _firestore_snapshot():
+    from services.metrics_service import FIRESTORE_OPS
+    with FIRESTORE_OPS._lock:
+        return dict(FIRESTORE_OPS._values)
+
+
+def run(base_url, states, plan, concurrency):
+    local = threading.local()
+    samples = defaultdict(list) # (metodo, regra) -> [(latencia ms, status)]
+    samples_lock = threading.Lock()
+    etags = {}
+
+    def execute(item):
+        scenario_index, sebo_index, draw = item
+        method, rule, _, build = SCENARIOS[scenario_index]
+        state = states[sebo_index]
+        call = build(state, sebo_index, random.Random(draw))
+        if call is None: # pool esgotado: cai para a leitura mais comum
+            method, rule, _, build = SCENARIOS[0]
+            call = build(state, sebo_index, random.Random(draw))
+        token, path, kwargs = call
+        headers = {"Accept-Encoding": "gzip, br"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        if method == "GET" and (state.sebo_id, path) in etags:
+            headers["If-None-Match"] = etags[(state.sebo_id, path)]
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.request(method, base_url + path, headers=headers, timeout=120, **kwargs)
+        _ = response.content
+        elapsed = (time.perf_counter() - started) * 1000.0
+        if response.headers.get("ETag"):
+            etags[(state.sebo_id, path)] = response.headers["ETag"]
+        with samples_lock:
+            samples[(method, rule)].append((elapsed, response.status_code))
+
+    before = _firestore_snapshot()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(execute, plan))
+    wall = time.perf_counter() - started
+    from services.alteration_log_service import flush_audit_logs
+    flush_audit_logs()
+    after = _firestore_snapshot()
+    return samples, wall, {key: after[key] - before.get(key, 0) for key in after}
+
+
+def summarize(samples, wall, firestore_ops, config):
+    routes = {}
+    for (method, rule), values in sorted(samples.items()):
+        latencies = sorted(elapsed for elapsed, _ in values)
+        count = len(values)
+        ops = {operation: firestore_ops.get((method, rule, operation), 0) / count
+               for operation in ("reads", "writes", "transactions")}
+        routes[f"{method} {rule}"] = {
+            "requests": count,
+            "errors": sum(1 for _, status in values if status >= 400),
+            "serverErrors": sum(1 for _, status in values if status >= 500),
+            "notModified": sum(1 for _, status in values if status == 304),
+            "p50Ms": round(percentile(latencies, 0.50), 2),
+            "p95Ms": round(percentile(latencies, 0.95), 2),
+            "p99Ms": round(percentile(latencies, 0.99), 2),
+            "readsPerRequest": round(ops["reads"], 2),
+            "writesPerRequest": round(ops["writes"], 2),
+            "transactionsPerRequest": round(ops["transactions"], 2),
+        }
+    total = sum(route["requests"] for route in routes.values())
+    all_latencies = sorted(elapsed for values in samples.values() for elapsed, _ in values)
+    background = {operation: firestore_ops.get(("", "background", operation), 0)
+                  for operation in ("reads", "writes", "transactions")}
+    return {
+        "recordedAt": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": config,
+        "total": {
+            "requests": total,
+            "errors": sum(route["errors"] for route in routes.values()),
+            "serverErrors": sum(route["serverErrors"] for route in routes.values()),
+            "wallSeconds": round(wall, 2),
+            "throughputRps": round(total / wall, 1) if wall else 0.0,
+            "p50Ms": round(percentile(all_latencies, 0.50), 2),
+            "p95Ms": round(percentile(all_latencies, 0.95), 2),
+            "p99Ms": round(percentile(all_latencies, 0.99), 2),
+            "backgroundFirestoreOps": background,
+        },
+        "routes": routes,
+    }
+
+
+def _delta(current, previous):
+    if not previous:
+        return ""
+    return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+
+def print_report(report, baseline=None):
+    baseline_routes = (baseline or {}).get("routes", {})
+    width = max(len(name) for name in report["routes"])
+    print(f"{'rota'.ljust(width)}  {'req':>5}  {'erros':>5}  {'304':>4}  {'p50 ms':>14}  {'p95 ms':>14}  "
+          f"{'p99 ms':>9}  {'leit/req':>14}  {'escr/req':>8}  {'tx/req':>6}")
+    for name, route in report["routes"].items():
+        previous = baseline_routes.get(name, {})
+        print(f"{name.ljust(width)}  {route['requests']:>5}  {route['errors']:>5}  {route['notModified']:>4}  "
+              f"{route['p50Ms']:>7.1f}{_delta(route['p50Ms'], previous.get('p50Ms')):>7}  "
+              f"{route['p95Ms']:>7.1f}{_delta(route['p95Ms'], previous.get('p95Ms')):>7}  "
+              f"{route['p99Ms']:>9.1f}  "
+              f"{route['readsPerRequest']:>7.1f}{_delta(route['readsPerRequest'], previous.get('readsPerRequest')):>7}  "
+              f"{route['writesPerRequest']:>8.1f}  {route['transactionsPerRequest']:>6.2f}")
+    total = report["total"]
+    previous_total = (baseline or {}).get("total", {})
+    print(f"\n{total['requests']} requisições em {total['wallSeconds']}s: "
+          f"{total['throughputRps']} req/s{_delta(total['throughputRps'], previous_total.get('throughputRps'))}, "
+          f"p50 {total['p50Ms']} ms, p95 {total['p95Ms']} ms, p99 {total['p99Ms']} ms, {total['errors']} erros "
+          f"({total['serverErrors']} 5xx)")
+    print(f"Firestore fora das requisições (fila de logs): {total['backgroundFirestoreOps']}")
+
+
+def check_errors(report, max_error_rate, max_server_error_rate):
+    """Mensagem de falha se as taxas de erro (4xx+5xx e so 5xx) passaram dos limites; None se ok."""
+    total = report["total"]
+    if not total["requests"]:
+        return "no requests were made"
+    failures = []
+    for label, count, limit in (("5xx", total["serverErrors"], max_server_error_rate),
+                                ("4xx/5xx", total["errors"], max_error_rate)):
+        rate = count / total["requests"]
+        if rate > limit:
+            routes = [name for name, route in report["routes"].items()
+                      if route["serverErrors" if label == "5xx" else "errors"]]
+            failures.append(f"{label} rate {rate:.2%} above {limit:.2%} ({', '.join(routes)})")
+    return "; ".join(failures) or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sebos", type=int, default=2)
+    parser.add_argument("--books", type=int, default=300, help="livros por sebo")
+    parser.add_argument("--copies", type=int, default=4, help="cópias por livro")
+    parser.add_argument("--sales", type=int, default=2000, help="vendas por sebo")
+    parser.add_argument("--logs", type=int, default=2000, help="logs por sebo")
+    parser.add_argument("--disposable-users", type=int, default=50, help="usuários por sebo reservados para DELETE /users")
+    parser.add_argument("--requests", type=int, default=3000, help="total de requisições disparadas")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--google-latency", type=float, default=0.05, help="latência (s) simulada da Google Books")
+    parser.add_argument("--fast-json", action="store_true", help="liga FAST_JSON=1 no app")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--project", default=PROJECT)
+    parser.add_argument("--emulator-host", default="127.0.0.1:8080")
+    parser.add_argument("--emulator-cmd", default="firebase emulators:start --only firestore --project {project}")
+    parser.add_argument("--output", help="grava o relatório em JSON (ex.: benchmarks/baseline.json)")
+    parser.add_argument("--compare", help="baseline JSON para mostrar a variação de cada rota")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="fração máxima de respostas 4xx/5xx; acima dela sai com código 1")
+    parser.add_argument("--max-server-error-rate", type=float, default=0.0,
+                        help="fração máxima de respostas 5xx; acima dela sai com código 1")
+    args = parser.parse_args()
+
+    emulator = start_emulator(args)
+    try:
+        prepare_environment(args)
+        reset_emulator(args.project)
+        install_auth_stubs()
+        from app import app # importa depois do ambiente pronto: os services leem as variaveis no import
+
+        missing = check_coverage(app)
+        if missing:
+            print(f"Rotas sem cenário no teste de carga: {', '.join(missing)}", file=sys.stderr)
+
+        rng = random.Random(args.seed)
+        print(f"Populando {args.sebos} sebo(s)...", file=sys.stderr)
+        states = seed(args, rng)
+        plan = plan_requests(states, args.requests, rng)
+        server, base_url = start_app_server(app)
+        print(f"Disparando {len(plan)} requisições com concorrência {args.concurrency}...", file=sys.stderr)
+        samples, wall, firestore_ops = run(base_url, states, plan, args.concurrency)
+        server.shutdown()
+
+        config = {key: value for key, value in vars(args).items()
+                  if key not in ("output", "compare", "emulator_cmd", "max_error_rate", "max_server_error_rate")}
+        report = summarize(samples, wall, firestore_ops, config)
+        baseline = None
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+        print_report(report, baseline)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as output_file:
+                json.dump(report, output_file, ensure_ascii=False, indent=2)
+                output_file.write("\n")
+    finally:
+        if emulator is not None:
+            emulator.terminate()
+    failure = check_errors(report, args.max_error_rate, args.max_server_error_rate)
+    if failure: # o relatorio ja foi gravado; o codigo de saida e o que o CI olha
+        sys.exit(f"Load test failed: {failure}")
+
+
+if __name__ == "__main__":
+    main()
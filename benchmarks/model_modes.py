@@ -0,0 +1,104 @@
+"""Mede linhas por segundo de cada modo de (de)serialização dos modelos em models/.
+
+Não acessa o Firestore: gera documentos no formato gravado pelos services (dump por
+alias dos próprios modelos) e, para cada modelo, compara:
+
+- model:    Model.model_validate(doc).model_dump(by_alias=True) linha a linha (caminho antigo)
+- adapter:  TypeAdapter(List[Model]) validando e serializando o lote numa chamada
+- trusted:  ModelAdapter.project, a leitura confiável que só projeta os campos
+
+e, nas atualizações de um campo, model_validate + model_copy + model_dump contra
+ModelAdapter.merge_update.
+
+    python -m benchmarks.model_modes --rows 20000
+"""
+import argparse
+import random
+import statistics
+import time
+from uuid import uuid4
+
+from models.alteration_log import AlterationLog
+from models.books import Book
+from models.copy import Copy
+from models.sales import Sales
+from models.sebos import Sebo
+from models.users import User
+from services.model_adapters import ModelAdapter
+
+
+STATES = ["Novo", "Bom", "Mediano", "Péssimo"]
+CATEGORIES = ["Ficção", "Romance", "História", "Fantasia", "Biografia", "Tecnologia"]
+
+
+def _copy(rng):
+    return {"copyId": uuid4().hex[:20], "price": round(rng.uniform(5, 120), 2),
+            "conservationState": rng.choice(STATES), "registeredAt": "2025-03-14T12:00:00+00:00"}
+
+
+FIXTURES = [
+    # (modelo, gera os dados de uma linha, atualizacao de um campo)
+    (AlterationLog, lambda i, rng: {"userId": f"user-{rng.randint(1, 20)}", "userName": "Vendedor",
+                                    "action": "Adicionar Livro", "details": {"ISBN": f"978{i:010d}", "price": 20.0}},
+     {"action": "Editar Livro"}),
+    (Sales, lambda i, rng: {"userId": f"user-{rng.randint(1, 20)}", "userName": "Vendedor", "ISBN": f"978{i:010d}",
+                            "bookTitle": f"Livro vendido {i}", "authors": ["Autor"], "bookCategory": rng.sample(CATEGORIES, 1),
+                            "averageRating": 4.2, "ratingsCount": 10, "bookPrice": round(rng.uniform(5, 120), 2),
+                            "conservationState": rng.choice(STATES)},
+     {"book_price": 42.0}),
+    (Book, lambda i, rng: {"ISBN": f"978{i:010d}", "title": f"Livro {i}", "authors": ["Autor"],
+                           "categories": rng.sample(CATEGORIES, 2), "description": "Descrição do livro. " * 8,
+                           "pageCount": 300, "totalQuantity": 3, "copySummaries": [_copy(rng) for _ in range(3)],
+                           "minPrice": 5.0, "maxPrice": 120.0, "avgPrice": 60.0},
+     {"total_quantity": 4}),
+    (Copy, lambda i, rng: _copy(rng), {"price": 30.0}),
+    (User, lambda i, rng: {"userId": f"user-{i}", "name": f"Usuário {i}", "email": f"user{i}@sebo.com",
+                           "nameSebo": "Sebo", "seboId": "sebo-1", "userRole": rng.choice(["Admin", "Editor", "Reader"])},
+     {"name": "Outro nome"}),
+    (Sebo, lambda i, rng: {"seboId": f"sebo-{i}", "userId": f"user-{i}", "nameSebo": f"Sebo {i}"},
+     {"name_sebo": "Sebo renomeado"}),
+]
+
+
+def build_rows(model, make_row, count, rng):
+    # documentos como os services gravam: validados pelo modelo e dump por alias
+    return [model.model_validate(make_row(index, rng)).model_dump(by_alias=True) for index in range(count)]
+
+
+def rows_per_second(func, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(rows)
+        timings.append(time.perf_counter() - started)
+    return len(rows) / statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="documentos por modelo")
+    parser.add_argument("--repeat", type=int, default=5, help="repetições; o resultado é a mediana")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'modelo':<14}  {'modo':<13}  {'linhas/s':>12}  {'vs model':>8}")
+    for model, make_row, update in FIXTURES:
+        rows = build_rows(model, make_row, args.rows, rng)
+        adapter = ModelAdapter(model)
+        modes = [
+            ("model", lambda rows: [model.model_validate(row).model_dump(by_alias=True) for row in rows]),
+            ("adapter", lambda rows: adapter.dump_many(adapter.validate_many(rows))),
+            ("trusted", lambda rows: [adapter.project(row) for row in rows]),
+            ("update/model", lambda rows: [model.model_validate(row).model_copy(update=update).model_dump(by_alias=True)
+                                           for row in rows]),
+            ("update/merge", lambda rows: [adapter.merge_update(row, update) for row in rows]),
+        ]
+        baseline = {}
+        for mode, func in modes:
+            rate = rows_per_second(func, rows, args.repeat)
+            reference = baseline.setdefault(mode.split("/")[0] if "/" in mode else "read", rate)
+            print(f"{model.__name__:<14}  {mode:<13}  {rate:>12,.0f}  {rate / reference:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Mede serialização JSON e bytes na rede para listagens grandes.
+
+Não acessa o Firestore: gera fixtures no formato dos documentos lidos
+(livros completos com cópias, como em fetch_book, e vendas como em
+fetch_all_sales) e compara o provider JSON padrão do Flask com o
+FastJSONProvider (orjson), cada um sem compressão, com gzip e com brotli.
+
+    python -m benchmarks.serialization --books 10000 --sales 50000
+"""
+import argparse
+import random
+import statistics
+import time
+from uuid import uuid4
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from models.books import Book
+from models.sales import Sales
+from services.response_utils import FastJSONProvider, compress_body, brotli, orjson
+
+
+CATEGORIES = ["Ficção", "Romance", "História", "Fantasia", "Biografia", "Tecnologia", "Poesia", "Infantil"]
+STATES = ["Novo", "Bom", "Mediano", "Péssimo"]
+
+
+def build_books(count, copies_per_book, rng):
+    books = []
+    for index in range(count):
+        ISBN = f"978{index:010d}"
+        copies = [{"copyId": uuid4().hex[:20], "price": round(rng.uniform(5, 120), 2),
+                   "conservationState": rng.choice(STATES), "registeredAt": "2025-03-14T12:00:00+00:00"}
+                  for _ in range(copies_per_book)]
+        book = Book.model_validate({
+            "ISBN": ISBN,
+            "title": f"Livro de teste número {index}",
+            "authors": [f"Autor {rng.randint(1, 2000)}"],
+            "publisher": f"Editora {rng.randint(1, 200)}",
+            "categories": rng.sample(CATEGORIES, 2),
+            "publishedDate": f"{rng.randint(1950, 2024)}",
+            "description": "Descrição do livro usada para dar volume realista à resposta. " * 4,
+            "pageCount": rng.randint(80, 900),
+            "language": "pt-BR",
+            "thumbnail": f"http://books.google.com/books/content?id={ISBN}&printsec=frontcover&img=1&zoom=1",
+            "totalQuantity": copies_per_book,
+            "copies": copies,
+        })
+        books.append(book.model_dump(by_alias=True, mode="json"))
+    return books
+
+
+def build_sales(count, rng):
+    sales = []
+    for index in range(count):
+        sale = Sales.model_validate({
+            "userId": f"user-{rng.randint(1, 20)}",
+            "userName": f"Vendedor {rng.randint(1, 20)}",
+            "ISBN": f"978{rng.randint(0, 9999999999):010d}",
+            "bookTitle": f"Livro vendido {index}",
+            "authors": [f"Autor {rng.randint(1, 2000)}"],
+            "bookCategory": rng.sample(CATEGORIES, 1),
+            "averageRating": round(rng.uniform(1, 5), 1),
+            "ratingsCount": rng.randint(0, 500),
+            "bookPrice": round(rng.uniform(5, 120), 2),
+            "conservationState": rng.choice(STATES),
+        })
+        sales.append(sale.model_dump(by_alias=True, mode="json"))
+    return sales
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return result, statistics.median(timings)
+
+
+def measure(app, payload, repeat):
+    rows = []
+    with app.app_context():
+        body, serialize_ms = timed(lambda: app.json.response(payload).get_data(), repeat)
+    rows.append(("identity", serialize_ms, 0.0, len(body)))
+    encodings = ["gzip", "br"] if brotli is not None else ["gzip"]
+    for encoding in encodings:
+        compressed, compress_ms = timed(lambda: compress_body(body, encoding), repeat)
+        rows.append((encoding, serialize_ms, compress_ms, len(compressed)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--copies", type=int, default=3, help="cópias embutidas em cada livro")
+    parser.add_argument("--sales", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5, help="repetições; o resultado é a mediana")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    fixtures = [
+        (f"{args.books} livros", build_books(args.books, args.copies, rng)),
+        (f"{args.sales} vendas", build_sales(args.sales, rng)),
+    ]
+    providers = [("flask", DefaultJSONProvider)]
+    if orjson is not None:
+        providers.append(("orjson", FastJSONProvider))
+    else:
+        print("orjson não instalado: medindo só o provider padrão")
+
+    print(f"{'fixture':<14}  {'provider':<8}  {'encoding':<8}  {'serializa ms':>12}  {'comprime ms':>11}  {'bytes':>11}")
+    for fixture_name, payload in fixtures:
+        for provider_name, provider_class in providers:
+            app = Flask(__name__)
+            app.json = provider_class(app)
+            for encoding, serialize_ms, compress_ms, size in measure(app, payload, args.repeat):
+                print(f"{fixture_name:<14}  {provider_name:<8}  {encoding:<8}  {serialize_ms:>12.1f}  "
+                      f"{compress_ms:>11.1f}  {size:>11,}")
+
+
+if __name__ == "__main__":
+    main()
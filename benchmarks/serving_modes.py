@@ -0,0 +1,148 @@
+"""Compara o gunicorn com workers sync e gevent sob concorrência crescente.
+
+Usa o mesmo ambiente do benchmarks.loadtest (emulador do Firestore, stubs de auth
+e da Google Books com latência configurável) e sobe o app com
+`gunicorn -c gunicorn.conf.py` uma vez por modo (WORKER_CLASS=sync ou gevent),
+com o mesmo número de workers. Em cada nível de concorrência dispara uma mistura
+de leituras de livro, vendas (create_sale) e cadastros por ISBN (que esperam a
+Google Books) e relata vazão e latência.
+
+    python -m benchmarks.serving_modes --modes sync,gevent --concurrency 1,16,64,256
+"""
+import argparse
+import math
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.loadtest import (PROJECT, _editor, _post_sale, _reader, _wait_for_port, install_auth_stubs,
+                                 percentile, prepare_environment, reset_emulator, seed, start_emulator)
+
+
+MIX = [
+    # mesmo formato de benchmarks.loadtest.SCENARIOS: (metodo, regra, peso, funcao que monta a chamada)
+    ("GET", "/books/<ISBN>", 5, lambda s, i, r: (_reader(s), f"/books/{r.choice(s.books)}", {})),
+    ("POST", "/sales/<ISBN>/<copy_id>", 3, _post_sale),
+    ("POST", "/books", 2, lambda s, i, r: (_editor(s), "/books", {"json": {"ISBN": s.new_isbn(i), "price": 25.0}})),
+]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(mode, workers):
+    port = _free_port()
+    env = dict(os.environ, WORKER_CLASS=mode)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+         "-b", f"127.0.0.1:{port}", "benchmarks.loadtest:create_app()"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    if not _wait_for_port(f"127.0.0.1:{port}", timeout=60):
+        process.terminate()
+        sys.exit(f"gunicorn ({mode}) did not start")
+    return process, f"http://127.0.0.1:{port}"
+
+
+def run_level(base_url, states, concurrency, total, rng):
+    weights = [weight for _, _, weight, _ in MIX]
+    plan = [(rng.choices(range(len(MIX)), weights)[0], rng.randrange(len(states)), rng.random())
+            for _ in range(total)]
+    local = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    def execute(item):
+        mix_index, sebo_index, draw = item
+        state = states[sebo_index]
+        method, _, _, build = MIX[mix_index]
+        call = build(state, sebo_index, random.Random(draw))
+        if call is None: # acabaram as copias: vira leitura
+            method, _, _, build = MIX[0]
+            call = build(state, sebo_index, random.Random(draw))
+        token, path, kwargs = call
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.request(method, base_url + path, headers={"Authorization": f"Bearer {token}"},
+                                         timeout=300, **kwargs)
+        _ = response.content
+        elapsed = (time.perf_counter() - started) * 1000.0
+        with results_lock:
+            results.append((elapsed, response.status_code))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(execute, plan))
+    wall = time.perf_counter() - started
+    latencies = sorted(elapsed for elapsed, _ in results)
+    return {
+        "throughputRps": len(results) / wall,
+        "p50Ms": percentile(latencies, 0.50),
+        "p95Ms": percentile(latencies, 0.95),
+        "p99Ms": percentile(latencies, 0.99),
+        "errors": sum(1 for _, status in results if status >= 400),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,gevent")
+    parser.add_argument("--workers", type=int, default=1, help="workers do gunicorn em cada modo")
+    parser.add_argument("--concurrency", default="1,16,64,256", help="níveis de requisições simultâneas")
+    parser.add_argument("--requests", type=int, default=400, help="requisições por nível")
+    parser.add_argument("--books", type=int, default=200, help="livros por sebo")
+    parser.add_argument("--google-latency", type=float, default=0.1, help="latência (s) simulada da Google Books")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--project", default=PROJECT)
+    parser.add_argument("--emulator-host", default="127.0.0.1:8080")
+    parser.add_argument("--emulator-cmd", default="firebase emulators:start --only firestore --project {project}")
+    args = parser.parse_args()
+    modes = args.modes.split(",")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    # copias suficientes para todas as vendas de todos os modos e niveis
+    sales_share = MIX[1][2] / sum(weight for _, _, weight, _ in MIX)
+    copies = math.ceil(args.requests * len(levels) * len(modes) * sales_share * 1.5 / args.books) + 1
+    seed_args = argparse.Namespace(sebos=1, books=args.books, copies=copies, sales=0, logs=0, disposable_users=0)
+    args.fast_json = False
+
+    emulator = start_emulator(args)
+    try:
+        prepare_environment(args)
+        reset_emulator(args.project)
+        install_auth_stubs()
+
+        rng = random.Random(args.seed)
+        print(f"Populando {args.books} livros com {copies} cópias cada...", file=sys.stderr)
+        states = seed(seed_args, rng)
+
+        print(f"{'modo':<8}  {'concorr.':>8}  {'req/s':>8}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'erros':>5}")
+        for mode in modes:
+            process, base_url = start_gunicorn(mode, args.workers)
+            try:
+                for level in levels:
+                    result = run_level(base_url, states, level, args.requests, rng)
+                    print(f"{mode:<8}  {level:>8}  {result['throughputRps']:>8.1f}  {result['p50Ms']:>9.1f}  "
+                          f"{result['p95Ms']:>9.1f}  {result['p99Ms']:>9.1f}  {result['errors']:>5}")
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=60)
+    finally:
+        if emulator is not None:
+            emulator.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Mede a disputa de escritas de estoque num único título, com e sem shards.
+
+Roda contra o emulador do Firestore (nunca contra produção):
+
+    firebase emulators:start --only firestore
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.stock_contention --modes 0:1,10:4 --concurrency 32
+
+Cada modo é `STOCK_SHARDS:COUNTER_SHARDS`: `0:1` é o layout sem shards (livro, versão e
+resumo do estoque num documento cada), `10:4` divide o estoque do livro e os contadores
+do sebo. Para cada modo cadastra um livro num sebo novo, dispara `--operations` escritas
+concorrentes no mesmo ISBN (metade add_manual_book, metade delete_copy de cópias
+pré-cadastradas) e relata vazão, latência e quantas tentativas das transactions foram
+repetidas por conflito. No fim dobra os shards e confere totalQuantity contra a
+subcoleção Copies.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import firebase_admin
+from google.cloud.firestore_v1 import transaction as transaction_module
+
+from benchmarks.firestore_reads import _EmulatorCredential
+from benchmarks.loadtest import percentile
+
+
+class RetryCounter:
+    def __init__(self):
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        original_begin = transaction_module.Transaction._begin
+
+        def begin(transaction, retry_id=None):
+            if retry_id is not None: # o _Transactional so passa retry_id a partir da segunda tentativa
+                with self._lock:
+                    self.retries += 1
+            return original_begin(transaction, retry_id=retry_id)
+
+        transaction_module.Transaction._begin = begin
+
+
+def run_mode(books_service, stock_service, counter_utils, sebo_id, ISBN, mode, args, retries):
+    shards, counter_shards = mode
+    stock_service.STOCK_SHARDS = shards
+    counter_utils.COUNTER_SHARDS = counter_shards
+    book_data = {"ISBN": ISBN, "title": f"Livro disputado ({shards} shards)", "authors": ["Autor"], "categories": ["Ficção"]}
+    for _ in range(args.operations // 2 + 1):
+        books_service.add_manual_book(sebo_id, dict(book_data), {"price": 20.0})
+    stock_service.flush_stock_folds()
+    stock_service.fold_stock(books_service._book_ref(sebo_id, ISBN))
+    copy_ids = [copy["copyId"] for copy in books_service.fetch_book(sebo_id, ISBN)["copies"]]
+
+    rng = random.Random(args.seed)
+    plan = [("add", None)] * (args.operations - args.operations // 2)
+    plan += [("delete", copy_id) for copy_id in rng.sample(copy_ids, args.operations // 2)]
+    rng.shuffle(plan)
+
+    def execute(item):
+        kind, copy_id = item
+        started = time.perf_counter()
+        try:
+            if kind == "add":
+                books_service.add_manual_book(sebo_id, dict(book_data), {"price": round(rng.uniform(5, 50), 2)})
+            else:
+                books_service.delete_copy(sebo_id, ISBN, copy_id)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    retries.retries = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(execute, plan))
+    wall = time.perf_counter() - started
+
+    stock_service.flush_stock_folds()
+    book_ref = books_service._book_ref(sebo_id, ISBN)
+    stock_service.fold_stock(book_ref)
+    stored = book_ref.get(field_paths=["totalQuantity"]).get("totalQuantity")
+    copies = sum(1 for _ in book_ref.collection("Copies").select([]).stream())
+    latencies = sorted(duration for duration, _ in samples)
+    return {
+        "shards": shards,
+        "contadores": counter_shards,
+        "ops/s": len(samples) / wall,
+        "p50 ms": statistics.median(latencies) * 1000,
+        "p95 ms": percentile(latencies, 0.95) * 1000,
+        "erros": sum(1 for _, ok in samples if not ok),
+        "retries": retries.retries,
+        "consistente": stored == copies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="0:1,10:4", help="pares STOCK_SHARDS:COUNTER_SHARDS, separados por vírgula")
+    parser.add_argument("--operations", type=int, default=400, help="escritas concorrentes por modo")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--project", default="volta-estante-bench")
+    args = parser.parse_args()
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("FIRESTORE_EMULATOR_HOST is not set; refusing to run against a real project")
+
+    firebase_admin.initialize_app(_EmulatorCredential(), {"projectId": args.project})
+    retries = RetryCounter()
+    retries.install()
+
+    from services import books_service, counter_utils, stock_service
+
+    results = []
+    for index, mode in enumerate(args.modes.split(",")):
+        shards, counter_shards = (int(value) for value in mode.split(":"))
+        # sebo novo por modo: os contadores de outro COUNTER_SHARDS nao seriam somados direito
+        sebo_id, ISBN = f"bench-sebo-{index}", f"97800000{index:05d}"
+        results.append(run_mode(books_service, stock_service, counter_utils, sebo_id, ISBN,
+                                (shards, counter_shards), args, retries))
+
+    columns = list(results[0])
+    print("  ".join(f"{column:>11}" for column in columns))
+    for result in results:
+        print("  ".join(f"{value:>11.1f}" if isinstance(value, float) else f"{str(value):>11}" for value in result.values()))
+
+
+if __name__ == "__main__":
+    main()
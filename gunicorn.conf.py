@@ -0,0 +1,48 @@
+# Carregado automaticamente pelo gunicorn (Procfile: gunicorn app:app).
+import os
+
+
+# sync (padrao): um worker atende uma requisicao por vez e fica parado esperando o Firestore
+# e a Google Books. gevent: cada worker atende ate WORKER_CONNECTIONS requisicoes ao mesmo
+# tempo, trocando de greenlet enquanto espera I/O (gRPC do Firestore e HTTP da Google Books).
+worker_class = os.getenv("WORKER_CLASS", "sync")
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "500"))
+
+
+def post_fork(server, worker):
+    # o gRPC do Firestore precisa ceder ao loop do gevent em vez de bloquear a thread inteira.
+    # O init_gevent exige o monkey patch ja aplicado e tem que rodar antes de o app criar o
+    # client; o worker do gevent so faz o patch depois deste hook (repetir o patch nao tem efeito)
+    if worker_class == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+        import grpc.experimental.gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+
+
+def post_worker_init(worker):
+    # o firebase_admin so e inicializado no primeiro uso; aqui so confere a configuracao para
+    # o worker nao subir sem credenciais
+    from services.firebase_client import credentials_configured
+    if not credentials_configured():
+        raise RuntimeError("Firebase service account not configured. Set FIREBASE_SERVICE_ACCOUNT_BASE64 or GOOGLE_APLICATION_CREDENTIALS")
+
+    # baixa os certificados de assinatura dos tokens em segundo plano, sem atrasar o worker
+    # a comecar a aceitar conexoes; o cache em disco (AUTH_CERT_CACHE_DIR) e compartilhado
+    # entre os workers. Uma requisicao que chegue antes so baixa os certificados ela mesma
+    import threading
+    from services.auth_service import prewarm_token_certificates
+
+    def prewarm():
+        if not prewarm_token_certificates():
+            worker.log.warning("Could not pre-warm Firebase token certificates")
+    threading.Thread(target=prewarm, name="prewarm-token-certificates", daemon=True).start()
+
+
+def worker_exit(server, worker):
+    # grava os logs de auditoria que ainda estao na fila e dobra os shards de estoque
+    # pendentes antes do worker morrer
+    from services.alteration_log_service import flush_audit_logs
+    from services.stock_service import flush_stock_folds
+    flush_audit_logs()
+    flush_stock_folds()
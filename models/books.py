@@ -23,4 +23,8 @@ class Book(BaseModel):
     text_snippet: Optional[str] = None
     total_quantity: int
     copies: List[Copy] = Field(default_factory=list)
+    copy_summaries: List[Copy] = Field(default_factory=list) # copia denormalizada das Copies, mantida pelas transactions
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    avg_price: Optional[float] = None
     
\ No newline at end of file
@@ -19,4 +19,5 @@ class Sales(BaseModel):
     ratings_count: Optional[int] = None
     book_price: float
     conservation_state: ConservationState
-    sale_date: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
\ No newline at end of file
+    sale_date: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    basket_id: Optional[str] = None
\ No newline at end of file
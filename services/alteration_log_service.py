@@ -1,12 +1,151 @@
 from flask import g, request
 from firebase_admin import firestore
+from services.firebase_client import db
 from models.alteration_log import AlterationLog
 from pydantic import ValidationError
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, NotFound
 from functools import wraps
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from services.pagination import encode_page_token, decode_page_token
+from services.version_service import bump_version
+from services.model_adapters import ModelAdapter
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
 import threading
+import time
 
-db = firestore.client()
+
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "10000"))
+AUDIT_LOG_BATCH_SIZE = min(int(os.getenv("AUDIT_LOG_BATCH_SIZE", "500")), 500) # limite de escritas por commit
+AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", "1.0"))
+AUDIT_LOG_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_LOG_ENQUEUE_TIMEOUT", "0.05"))
+AUDIT_LOG_COMMIT_RETRIES = 3
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "90"))
+ARCHIVE_CHUNK_SIZE = 498 # 1 documento de arquivo + 498 deletes + versao por commit
+ARCHIVE_MAX_LOGS = int(os.getenv("ARCHIVE_MAX_LOGS", "5000")) # por chamada, para caber no timeout do worker
+
+logger = logging.getLogger(__name__)
+
+LOG_ADAPTER = ModelAdapter(AlterationLog)
+
+
+class _AuditLogWriter:
+    """Fila limitada drenada por uma unica thread que grava os logs em batch commits.
+
+    Quando a fila enche, log_action espera ate AUDIT_LOG_ENQUEUE_TIMEOUT e depois
+    descarta o log (contado em `dropped`), sem travar a requisicao.
+    """
+
+    def __init__(self, maxsize, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _ensure_started(self):
+        # a thread so nasce no primeiro log, ja dentro do worker (depois do fork)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, sebo_id, log_entry):
+        self._ensure_started()
+        try:
+            self._queue.put((sebo_id, log_entry), timeout=AUDIT_LOG_ENQUEUE_TIMEOUT)
+            self._count("enqueued")
+        except queue.Full:
+            self._count("dropped")
+
+    def _drain(self):
+        try:
+            entries = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        sebo_ids = {entries[0][0]}
+        while len(entries) + len(sebo_ids) < self.batch_size - 1: # + 1 escrita de versao por sebo
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    entries.append(self._queue.get(timeout=remaining))
+                elif self._stopping.is_set(): # desligando: esvazia a fila sem esperar
+                    entries.append(self._queue.get_nowait())
+                else:
+                    break
+                sebo_ids.add(entries[-1][0])
+            except queue.Empty:
+                break
+        return entries
+
+    def _write(self, entries):
+        for attempt in range(AUDIT_LOG_COMMIT_RETRIES):
+            try:
+                batch = db.batch()
+                for sebo_id, log_entry in entries:
+                    log_ref = db.collection('Sebos').document(sebo_id).collection('AlterationLogs').document(log_entry.log_id)
+                    batch.set(log_ref, log_entry.model_dump(by_alias=True))
+                for sebo_id in {sebo_id for sebo_id, _ in entries}:
+                    bump_version(batch, sebo_id, "logs")
+                batch.commit()
+                self._count("written", len(entries))
+                self._count("batches")
+                return
+            except Exception as e:
+                logger.warning(f"Audit log batch commit failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.2 * (2 ** attempt))
+        self._count("failed", len(entries))
+
+    def _run(self):
+        while True:
+            entries = self._drain()
+            if entries:
+                self._write(entries)
+                for _ in entries:
+                    self._queue.task_done()
+            elif self._stopping.is_set():
+                return
+
+    def flush(self, timeout=10.0):
+        """Grava o que estiver na fila e encerra a thread; usado no desligamento do worker."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+
+_audit_writer = _AuditLogWriter(AUDIT_LOG_QUEUE_SIZE, AUDIT_LOG_BATCH_SIZE, AUDIT_LOG_FLUSH_INTERVAL)
+atexit.register(_audit_writer.flush)
+
+
+def flush_audit_logs(timeout=10.0):
+    _audit_writer.flush(timeout)
+
+
+def audit_log_stats():
+    return _audit_writer.snapshot()
 
 def save_log(sebo_id, user_id, user_name, action, details):
         log_data = {
@@ -18,7 +157,10 @@ def save_log(sebo_id, user_id, user_name, action, details):
         try:
             log_entry = AlterationLog.model_validate(log_data)
             log_ref = db.collection('Sebos').document(sebo_id).collection('AlterationLogs').document(log_entry.log_id)
-            log_ref.set(log_entry.model_dump(by_alias=True))
+            batch = db.batch()
+            batch.set(log_ref, log_entry.model_dump(by_alias=True))
+            bump_version(batch, sebo_id, "logs")
+            batch.commit()
         except (ValidationError, Exception) as e:
             raise BadRequest(f"Invalid log data: {e}")
   
@@ -27,24 +169,134 @@ def fetch_log(sebo_id, log_id):
     log_doc = log_ref.get()
     if not log_doc.exists:
         raise BadRequest(f"Log with ID {log_id} not found")
-    log_data = log_doc.to_dict()
-    try:
-        validated_log = AlterationLog.model_validate(log_data)
-        return validated_log.model_dump(by_alias=True)
-    except ValidationError:
+    log = LOG_ADAPTER.project(log_doc.to_dict())
+    if log is None:
         raise BadRequest(f"Invalid log data for log ID {log_id}")
+    return log
 
 def fetch_all_logs(sebo_id):
     logs_ref = db.collection('Sebos').document(sebo_id).collection('AlterationLogs')
     logs_docs = logs_ref.stream()
     logs = []
     for log_doc in logs_docs:
-        log_data = log_doc.to_dict()
+        log = LOG_ADAPTER.project(log_doc.to_dict()) # gravado via AlterationLog: so projeta
+        if log is not None:
+            logs.append(log)
+    return logs
+
+def fetch_logs_page(sebo_id, limit, start_after=None, user_id=None, action=None,
+                    date_from=None, date_to=None):
+    query = db.collection('Sebos').document(sebo_id).collection('AlterationLogs')
+    if user_id:
+        query = query.where('userId', '==', user_id)
+    if action:
+        query = query.where('action', '==', action)
+    if date_from:
+        query = query.where('timestamp', '>=', date_from)
+    if date_to:
+        query = query.where('timestamp', '<', date_to)
+    query = query.order_by('timestamp', direction=firestore.Query.DESCENDING).order_by(
+        '__name__', direction=firestore.Query.DESCENDING)
+
+    cursor = decode_page_token(start_after)
+    if cursor:
+        if set(cursor) != {'timestamp', '__name__'}:
+            raise BadRequest("startAfter token does not match the requested filters")
+        query = query.start_after(cursor)
+
+    log_docs = list(query.limit(limit + 1).stream())
+    has_more = len(log_docs) > limit
+    log_docs = log_docs[:limit]
+
+    logs = [log for log in (LOG_ADAPTER.project(log_doc.to_dict()) for log_doc in log_docs) if log is not None]
+    next_token = None
+    if has_more:
+        last = log_docs[-1]
+        next_token = encode_page_token({'timestamp': last.get('timestamp'), '__name__': last.id})
+    return {"logs": logs, "nextPageToken": next_token}
+
+def archive_old_logs(sebo_id, older_than_days=LOG_RETENTION_DAYS, cutoff=None, max_logs=ARCHIVE_MAX_LOGS):
+    """Move logs mais antigos que `older_than_days` para documentos de arquivo por mes.
+
+    Cada documento em AlterationLogArchives guarda ate 498 logs de um mesmo mes como
+    NDJSON comprimido com gzip; o arquivo e a remocao dos logs vao no mesmo commit.
+    Arquiva no maximo ~`max_logs` por chamada: com `hasMore` a chamada seguinte, com o
+    `cutoff` devolvido, continua de onde esta parou.
+    """
+    if cutoff is None:
+        if older_than_days < 1:
+            raise BadRequest("olderThanDays must be at least 1")
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    else:
         try:
-            validated_log = AlterationLog.model_validate(log_data)
-            logs.append(validated_log.model_dump(by_alias=True))
-        except ValidationError:
-            continue
+            parsed = datetime.fromisoformat(cutoff)
+        except (TypeError, ValueError):
+            raise BadRequest("cutoff must be an ISO 8601 date-time")
+        if parsed.tzinfo is None:
+            raise BadRequest("cutoff must include a timezone")
+        cutoff = parsed.astimezone(timezone.utc).isoformat() # mesmo formato dos timestamps gravados
+    sebo_ref = db.collection('Sebos').document(sebo_id)
+    logs_ref = sebo_ref.collection('AlterationLogs')
+    archives_ref = sebo_ref.collection('AlterationLogArchives')
+
+    archived = 0
+    archives = 0
+    has_more = False
+    while True:
+        if archived >= max_logs:
+            has_more = True
+            break
+        log_docs = list(logs_ref.where('timestamp', '<', cutoff).order_by('timestamp')
+                        .limit(ARCHIVE_CHUNK_SIZE).stream())
+        if not log_docs:
+            break
+        by_month = {}
+        for log_doc in log_docs:
+            log_data = log_doc.to_dict()
+            by_month.setdefault((log_data.get('timestamp') or '')[:7], []).append((log_doc, log_data))
+        for month, month_logs in by_month.items():
+            lines = "\n".join(json.dumps(log_data, ensure_ascii=False, default=str) for _, log_data in month_logs)
+            timestamps = [log_data.get('timestamp') for _, log_data in month_logs]
+            batch = db.batch()
+            batch.set(archives_ref.document(f"{month}-{uuid4().hex[:12]}"), {
+                "month": month,
+                "count": len(month_logs),
+                "firstTimestamp": min(timestamps),
+                "lastTimestamp": max(timestamps),
+                "archivedAt": datetime.now(timezone.utc).isoformat(),
+                "encoding": "gzip+ndjson",
+                "data": gzip.compress(lines.encode("utf-8")),
+            })
+            for log_doc, _ in month_logs:
+                batch.delete(log_doc.reference)
+            bump_version(batch, sebo_id, "logs")
+            batch.commit()
+            archived += len(month_logs)
+            archives += 1
+        if len(log_docs) < ARCHIVE_CHUNK_SIZE:
+            break
+    return {"archivedLogs": archived, "archiveDocuments": archives, "cutoff": cutoff, "hasMore": has_more}
+
+def fetch_log_archives(sebo_id):
+    archives_ref = db.collection('Sebos').document(sebo_id).collection('AlterationLogArchives')
+    query = archives_ref.select(['month', 'count', 'firstTimestamp', 'lastTimestamp', 'archivedAt'])
+    months = {}
+    for archive_doc in query.stream():
+        archive = archive_doc.to_dict()
+        summary = months.setdefault(archive['month'], {"month": archive['month'], "count": 0, "documents": 0})
+        summary["count"] += archive.get('count', 0)
+        summary["documents"] += 1
+    return sorted(months.values(), key=lambda summary: summary["month"], reverse=True)
+
+def fetch_archived_logs(sebo_id, month):
+    archives_ref = db.collection('Sebos').document(sebo_id).collection('AlterationLogArchives')
+    logs = []
+    for archive_doc in archives_ref.where('month', '==', month).stream():
+        data = archive_doc.get('data')
+        logs.extend(json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines() if line)
+    if not logs:
+        raise NotFound(f"No archived logs for month {month}")
+    logs.sort(key=lambda log: log.get('timestamp') or '', reverse=True)
     return logs
 
 def update_log(sebo_id, log_id, update_data):
@@ -53,16 +305,16 @@ def update_log(sebo_id, log_id, update_data):
     if not log_doc.exists:
         raise BadRequest(f"Log with ID {log_id} not found")
     try:
-        log_data = log_doc.to_dict()
-        validated_log = AlterationLog.model_validate(log_data)
-        updated_fields = validated_log.model_copy(update=update_data)
-        log_ref.update(updated_fields.model_dump(by_alias=True))
-        return updated_fields.model_dump(by_alias=True)    
+        updated_log = LOG_ADAPTER.merge_update(log_doc.to_dict(), update_data) # valida so os campos enviados
+        batch = db.batch()
+        batch.update(log_ref, updated_log)
+        bump_version(batch, sebo_id, "logs")
+        batch.commit()
+        return updated_log
     except (ValidationError, Exception) as e:
         raise BadRequest(f"Invalid log data: {e}")
 
 
-
 def log_action(action):
     def decorator(func):
         @wraps(func)
@@ -80,12 +332,16 @@ def log_action(action):
                         if isinstance(value, (str, int, float, bool)):
                             details[key] = value
             if sebo_id and user_id:
-                thread = threading.Thread(
-                    target=save_log,
-                    args=(sebo_id, user_id, user_name, action, details),
-                    daemon=True 
-                )
-                thread.start()
+                try:
+                    log_entry = AlterationLog.model_validate({
+                        "user_id": user_id,
+                        "user_name": user_name or 'Unknown User',
+                        "action": action,
+                        "details": details
+                    })
+                except ValidationError:
+                    return result
+                _audit_writer.enqueue(sebo_id, log_entry)
             return result
         return wrapper
     return decorator
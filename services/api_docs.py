@@ -0,0 +1,101 @@
+from flask import Response
+import glob
+import hashlib
+import json
+import logging
+import os
+
+
+# A spec OpenAPI e pre-compilada (`flask --app app build-spec`) para swagger_docs/apispec.json
+# e servida da memoria. O flasgger (e o jsonschema que ele importa) so e carregado com a
+# UI ligada (API_DOCS=1); sem ela /apispec.json continua disponivel a partir do arquivo.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCS_DIR = os.path.join(ROOT_DIR, "swagger_docs")
+SPEC_PATH = os.path.join(DOCS_DIR, "apispec.json")
+SPEC_ROUTE = "/apispec.json"
+API_DOCS = os.getenv("API_DOCS", "1").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+
+def swag_from(specs):
+    """Mesmo efeito do swag_from do flasgger para um YAML: so anota a view.
+
+    Nao importa o flasgger e nao embrulha a view (uma chamada a menos por requisicao);
+    o flasgger le `swag_path` das views ao gerar a spec.
+    """
+    path = specs if os.path.isabs(specs) else os.path.join(ROOT_DIR, specs)
+    def decorator(function):
+        function.swag_path = path
+        function.swag_type = path.rsplit('.', 1)[-1]
+        return function
+    return decorator
+
+
+def _is_docs_endpoint(endpoint):
+    return endpoint in ("static", "apispec") or endpoint.startswith("flasgger.")
+
+
+def sources_hash(app, template):
+    """Hash dos YAML, das rotas da API e do template: muda sempre que a spec gerada mudaria."""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(DOCS_DIR, "*.yml"))):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: (rule.rule, rule.endpoint)):
+        if not _is_docs_endpoint(rule.endpoint):
+            view = app.view_functions.get(rule.endpoint)
+            swag_path = os.path.relpath(getattr(view, "swag_path", ""), ROOT_DIR) if getattr(view, "swag_path", None) else ""
+            digest.update(f"{rule.rule} {sorted(rule.methods)} {rule.endpoint} {swag_path}\n".encode("utf-8"))
+    digest.update(json.dumps(template, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _load_precompiled_spec(app, template):
+    try:
+        with open(SPEC_PATH, "rb") as spec_file:
+            body = spec_file.read()
+    except FileNotFoundError:
+        return None
+    spec = json.loads(body)
+    if spec.get("x-source-hash") != sources_hash(app, template):
+        logger.warning("%s is out of date; run `flask --app app build-spec`", SPEC_PATH)
+        return None
+    return body
+
+
+def _build_swagger(app, config, template):
+    from flasgger import Swagger
+    return Swagger(app, config=config, template=template)
+
+
+def init_api_docs(app, config, template):
+    """Registra /apispec.json (pre-compilada) e, com API_DOCS ligado, a UI do flasgger.
+
+    Chamar depois de registrar todas as rotas: o hash da spec depende delas.
+    """
+    spec_body = _load_precompiled_spec(app, template)
+    def apispec_view():
+        return Response(spec_body, mimetype="application/json")
+
+    if API_DOCS:
+        _build_swagger(app, config, template)
+        if spec_body is not None: # sem arquivo valido o flasgger gera a spec no primeiro acesso, como antes
+            app.view_functions["flasgger.apispec"] = apispec_view
+    elif spec_body is not None:
+        app.add_url_rule(SPEC_ROUTE, "apispec", apispec_view)
+
+
+def build_api_spec(app, config, template):
+    """Gera a spec com o flasgger e grava em SPEC_PATH com o hash das fontes."""
+    swagger = getattr(app, "swag", None) or _build_swagger(app, config, template)
+    swagger.apispecs.clear() # ignora o cache do flasgger
+    with app.test_request_context():
+        spec = swagger.get_apispecs("apispec")
+    spec = json.loads(json.dumps(spec, default=str))
+    spec["x-source-hash"] = sources_hash(app, template)
+    with open(SPEC_PATH, "w", encoding="utf-8") as spec_file:
+        json.dump(spec, spec_file, ensure_ascii=False, indent=1, sort_keys=True)
+        spec_file.write("\n")
+    return SPEC_PATH
@@ -1,8 +1,130 @@
 from firebase_admin import auth
+import firebase_admin
 from werkzeug.exceptions import Unauthorized, Forbidden
 from flask import request, g
 from models.users import UserRole
 from functools import wraps
+from cachecontrol import CacheControl
+from cachecontrol.cache import BaseCache
+from services.cache_utils import TTLCache
+from services.firebase_client import get_firebase_app
+from services.metrics_service import AUTH_LATENCY
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import requests
+
+
+# tokens ja verificados ficam em cache ate no maximo o `exp` do proprio token
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+AUTH_CERT_CACHE_DIR = os.getenv("AUTH_CERT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "volta-estante-certs"))
+
+_token_cache = TTLCache(maxsize=AUTH_TOKEN_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL)
+_verify_stats = {"cacheHits": 0, "verifications": 0, "failures": 0, "totalMs": 0.0, "maxMs": 0.0}
+_stats_lock = threading.Lock()
+# o prewarm mexe em internals do firebase_admin (CertificateFetchRequest do 7.x, versao fixada no
+# requirements.txt); em outra major ele nao e aplicado e o aviso fica no log
+PREWARM_FIREBASE_ADMIN_MAJOR = "7"
+
+logger = logging.getLogger(__name__)
+
+
+class _SharedCertCache(BaseCache):
+    """Cache HTTP em disco para os certificados do Google, compartilhado entre os workers do gunicorn."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as cache_file:
+                return cache_file.read()
+        except OSError:
+            return None
+
+    def set(self, key, value, expires=None):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as cache_file:
+            cache_file.write(value)
+        os.replace(tmp_path, self._path(key)) # troca atomica, outro worker nunca le arquivo pela metade
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+def prewarm_token_certificates(app=None):
+    """Faz o verificador do firebase usar o cache compartilhado e ja baixa os certificados.
+
+    Chamado pelo gunicorn.conf.py quando cada worker sobe, para que a primeira
+    requisicao nao pague o download das chaves publicas.
+    """
+    if firebase_admin.__version__.split(".")[0] != PREWARM_FIREBASE_ADMIN_MAJOR:
+        logger.warning(f"Shared token certificate cache disabled: untested firebase_admin {firebase_admin.__version__}")
+        return False
+    try:
+        verifier = auth._get_client(app or get_firebase_app())._token_verifier
+        verifier.request._session = CacheControl(requests.Session(), cache=_SharedCertCache(AUTH_CERT_CACHE_DIR))
+        verifier.request._delegate.session = verifier.request._session
+        verifier.request(verifier.id_token_verifier.cert_url)
+        return True
+    except Exception:
+        logger.exception("Could not pre-warm token certificates; the shared certificate cache may be disabled")
+        return False
+
+
+def token_verification_stats():
+    with _stats_lock:
+        stats = dict(_verify_stats)
+    stats["avgMs"] = stats["totalMs"] / stats["verifications"] if stats["verifications"] else 0.0
+    stats["cachedTokens"] = len(_token_cache)
+    return stats
+
+
+def _record_verification(duration_ms, failed=False):
+    with _stats_lock:
+        _verify_stats["verifications"] += 1
+        _verify_stats["totalMs"] += duration_ms
+        _verify_stats["maxMs"] = max(_verify_stats["maxMs"], duration_ms)
+        if failed:
+            _verify_stats["failures"] += 1
+
+
+def _decode_token(token):
+    started = time.perf_counter()
+    cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    decoded_token = _token_cache.get(cache_key)
+    if decoded_token is not None and decoded_token.get('exp', 0) > time.time():
+        with _stats_lock:
+            _verify_stats["cacheHits"] += 1
+        AUTH_LATENCY.observe(time.perf_counter() - started, "cached")
+        return decoded_token
+
+    try:
+        decoded_token = auth.verify_id_token(token)
+    except Exception:
+        duration = time.perf_counter() - started
+        _record_verification(duration * 1000.0, failed=True)
+        AUTH_LATENCY.observe(duration, "failed")
+        raise
+    duration = time.perf_counter() - started
+    _record_verification(duration * 1000.0)
+    AUTH_LATENCY.observe(duration, "verified")
+
+    ttl = min(AUTH_TOKEN_CACHE_TTL, decoded_token.get('exp', 0) - time.time())
+    if ttl > 0:
+        _token_cache.set(cache_key, decoded_token, ttl=ttl)
+    return decoded_token
 
 
 
@@ -16,7 +138,7 @@ def _get_token_from_header():
 
 def _verify_token(token, claims_required=True):
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = _decode_token(token)
         g.user_id = decoded_token['uid']
         g.email = decoded_token['email']
         g.name = decoded_token.get('name')
@@ -45,6 +167,7 @@ def permission_required(*required_role, claims_required=True):
     def decorator(func):
         @wraps(func)
         def decorated_function(*args, **kwargs):
+            get_firebase_app() # criado no primeiro uso; fora do try do _verify_token para erro de configuracao nao virar 401
             token = _get_token_from_header()
             _verify_token(token, claims_required=claims_required)
             if claims_required:
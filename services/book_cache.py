@@ -0,0 +1,182 @@
+from services.cache_utils import TTLCache
+from collections import Counter
+import copy
+import logging
+import os
+import pickle
+import threading
+
+try:
+    import redis
+except ImportError: # opcional: so e necessario com BOOK_CACHE_URL
+    redis = None
+
+
+# cache read-through de GET /books/<ISBN> (livro + copias), chave (seboId, ISBN).
+# Toda escrita em books_service/sales_service que mexe no livro invalida a entrada depois
+# do commit; o TTL limita o quanto outro worker pode servir uma versao antiga quando o
+# backend e o LRU local (cada worker tem o seu). Com o backend compartilhado a invalidacao
+# vale para todos os workers.
+BOOK_CACHE_SIZE = int(os.getenv("BOOK_CACHE_SIZE", "4096"))
+BOOK_CACHE_TTL = float(os.getenv("BOOK_CACHE_TTL", "30")) # 0 desliga o cache
+BOOK_CACHE_URL = os.getenv("BOOK_CACHE_URL") # ex.: redis://localhost:6379/0; vazio usa o LRU do worker
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBookCacheBackend:
+    """LRU em memoria do worker. Guarda e devolve copias, para quem chama poder alterar o livro."""
+
+    shared = False
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations = TTLCache(maxsize=maxsize, ttl=max(ttl, 1.0))
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(geracao da chave, livro ou None); a geracao volta no set do livro lido depois."""
+        with self._lock:
+            generation = self._generations.get(key, 0)
+            value = self._cache.get(key)
+        return generation, None if value is None else copy.deepcopy(value)
+
+    def set(self, key, value, generation):
+        value = copy.deepcopy(value)
+        with self._lock:
+            if self._generations.get(key, 0) == generation: # invalidado desde o get: o livro pode ser antigo
+                self._cache.set(key, value)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._generations.set(key, self._generations.get(key, 0) + 1)
+                self._cache.pop(key)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SharedBookCacheBackend:
+    """Cache compartilhado entre workers num servidor compativel com Redis.
+
+    Cada chave tem um contador de geracao no servidor (`{prefix}gen:{key}`), incrementado a
+    cada invalidacao, e o livro e gravado junto com a geracao lida antes do loader. Um livro
+    gravado por um worker que leu antes da invalidacao de outro fica com geracao antiga e e
+    ignorado, entao a garantia vale entre workers. `client` so precisa de mget(keys),
+    set(key, value, ex=segundos), delete(*keys), incr(key) e expire(key, segundos), entao um
+    stand-in local (ex.: nos benchmarks) pode substituir o redis.Redis.
+    """
+
+    shared = True
+
+    def __init__(self, client, ttl, prefix="volta:book:"):
+        self._client = client
+        self._ttl = max(1, int(ttl))
+        # a geracao vive bem mais que o livro: se expirasse antes, voltaria a uma geracao ja usada
+        self._generation_ttl = max(3600, 10 * self._ttl)
+        self._prefix = prefix
+
+    def get(self, key):
+        raw, generation = self._client.mget([self._prefix + key, self._prefix + "gen:" + key])
+        generation = int(generation or 0)
+        if raw is None:
+            return generation, None
+        stored_generation, value = pickle.loads(raw) # pickle: as datas das copias voltam como datetime
+        return generation, value if stored_generation == generation else None
+
+    def set(self, key, value, generation):
+        self._client.set(self._prefix + key, pickle.dumps((generation, value)), ex=self._ttl)
+
+    def delete(self, keys):
+        for key in keys:
+            generation_key = self._prefix + "gen:" + key
+            self._client.incr(generation_key)
+            self._client.expire(generation_key, self._generation_ttl)
+        if keys:
+            self._client.delete(*(self._prefix + key for key in keys))
+
+
+def _default_backend():
+    if not BOOK_CACHE_URL:
+        return LocalBookCacheBackend(BOOK_CACHE_SIZE, BOOK_CACHE_TTL)
+    if redis is None:
+        raise RuntimeError("BOOK_CACHE_URL requires the redis package")
+    return SharedBookCacheBackend(redis.Redis.from_url(BOOK_CACHE_URL), BOOK_CACHE_TTL)
+
+
+# Uma leitura que comecou antes de uma invalidacao nao pode deixar no cache o livro que leu
+# (poderia ser anterior ao commit): cada backend guarda uma geracao por chave, devolvida no
+# get e conferida no set.
+_backend = _default_backend() if BOOK_CACHE_TTL > 0 else None
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def set_book_cache_backend(backend):
+    """Troca o backend (None desliga o cache); usado para plugar um backend compartilhado."""
+    global _backend
+    _backend = backend
+
+
+def _count(event, amount=1):
+    with _counters_lock:
+        _counters[event] += amount
+
+
+def _key(sebo_id, ISBN):
+    return f"{sebo_id}/{ISBN}"
+
+
+def cached_book(sebo_id, ISBN, loader):
+    """Devolve o livro do cache ou chama `loader()` e guarda o resultado. Falhas do backend viram miss."""
+    backend = _backend
+    if backend is None:
+        return loader()
+    key = _key(sebo_id, ISBN)
+    try:
+        generation, book = backend.get(key)
+    except Exception as e:
+        logger.warning(f"Error reading book cache: {e}", exc_info=True)
+        _count("errors")
+        generation, book = None, None
+    if book is not None:
+        _count("hits")
+        return book
+    _count("misses")
+    book = loader()
+    if generation is not None: # sem a geracao nao da para saber se o livro ainda vale
+        try:
+            backend.set(key, book, generation)
+        except Exception as e:
+            logger.warning(f"Error writing book cache: {e}", exc_info=True)
+            _count("errors")
+    return book
+
+
+def invalidate_books(sebo_id, ISBNs):
+    """Remove do cache os livros `ISBNs` do sebo; chamar depois do commit da escrita."""
+    backend = _backend
+    if backend is None:
+        return
+    keys = [_key(sebo_id, ISBN) for ISBN in set(ISBNs)]
+    try:
+        backend.delete(keys)
+    except Exception as e:
+        logger.warning(f"Error invalidating book cache: {e}", exc_info=True)
+        _count("errors")
+    _count("invalidations", len(keys))
+
+
+def book_cache_stats() -> dict:
+    with _counters_lock:
+        stats = dict(_counters)
+    for event in ("hits", "misses", "invalidations", "errors"):
+        stats.setdefault(event, 0)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hitRatio"] = stats["hits"] / lookups if lookups else 0.0
+    backend = _backend
+    stats["enabled"] = backend is not None
+    if isinstance(backend, LocalBookCacheBackend):
+        stats["memoryEntries"] = len(backend)
+    return stats
@@ -1,12 +1,33 @@
 from firebase_admin import firestore
+from services.firebase_client import db
 from werkzeug.exceptions import NotFound, BadRequest
 from models.books import Book
 from models.copy import Copy
 from pydantic import ValidationError
 from services.isbn_utils import sanitize_isbn
+from services.pagination import encode_page_token, decode_page_token
+from services.google_books_service import fetch_books_by_isbn
+from services.search_index_service import index_book, unindex_book, FIELD_WEIGHTS
+from services.version_service import bump_version
+from services.inventory_service import inventory_delta, apply_inventory_delta
+from services.book_cache import cached_book, invalidate_books
+from services.model_adapters import ModelAdapter
+from services.stock_service import (copy_summary, copy_summary_fields, load_copy_summaries, sharded_stock,
+                                    record_stock_delta, stock_shard_write, merge_stock_shards, fetch_stock_shards,
+                                    delete_stock_shards, schedule_stock_fold)
+import csv
+import io
 
 
-db = firestore.client() 
+BATCH_LIMIT = 500 # maximo de operacoes por commit no firestore
+BULK_MAX_ROWS = 2000
+BOOK_LIST_FIELDS = ['title', 'authors', 'categories', 'totalQuantity', 'isbn', 'minPrice', 'maxPrice', 'avgPrice']
+COPY_ADAPTER = ModelAdapter(Copy)
+
+
+def _stock_read_fields():
+    # com o estoque em shards a lista de copias do livro nao e regravada, entao nao precisa ser lida
+    return ['categories'] if sharded_stock() else ['totalQuantity', 'categories', 'copySummaries']
 
 
 def save_book(sebo_id, book_data, inventory_data):
@@ -21,26 +42,44 @@ def save_book(sebo_id, book_data, inventory_data):
         raise BadRequest("Invalid book data: Missing or invalid ISBN-13")
     book_ref = sebo_ref.collection('Books').document(ISBN)
     
-    book_doc = book_ref.get()
-    book_exists = book_doc.exists
-    
     transaction = db.transaction()
     @firestore.transactional
-    def save_book_transaction(transaction, book_ref, copy, book_exists):
-        if not book_exists:
+    def save_book_transaction(transaction, book_ref, copy):
+        # leitura dentro da transaction: evita um get extra e a corrida entre checar e criar o livro
+        book_doc = book_ref.get(field_paths=_stock_read_fields(), transaction=transaction)
+        copy_ref = book_ref.collection('Copies').document()
+        copy_data = copy.model_dump(by_alias=True, exclude={'copyId'})
+        copy_data['copyId'] = copy_ref.id
+        if not book_doc.exists:
             book_data['totalQuantity'] = 1
             book_data['ISBN'] = book_ref.id
             book = Book.model_validate(book_data)
-            transaction.set(book_ref, book.model_dump(by_alias=True, exclude={'copies'}))
+            book_dump = book.model_dump(by_alias=True, exclude={'copies'})
+            book_dump.update(copy_summary_fields([copy_summary(copy_data)]))
+            transaction.set(book_ref, book_dump)
+            index_book(transaction, sebo_id, book_dump)
+            categories = book_dump.get('categories')
+            new_titles = [categories]
+        elif sharded_stock(): # o livro so e lido; a copia entra num shard do estoque
+            stored = book_doc.to_dict()
+            record_stock_delta(transaction, book_ref, added=[copy_summary(copy_data)])
+            categories = stored.get('categories')
+            new_titles = []
         else:
-            transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(1)})
+            stored = book_doc.to_dict()
+            summaries = load_copy_summaries(book_ref, stored, transaction) + [copy_summary(copy_data)]
+            transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(1),
+                                          **copy_summary_fields(summaries)})
+            categories = stored.get('categories')
+            new_titles = []
         
-        copy_ref = book_ref.collection('Copies').document()
-        copy_data = copy.model_dump(by_alias=True, exclude={'copyId'})
-        copy_data['copyId'] = copy_ref.id  
         transaction.set(copy_ref, copy_data)
+        apply_inventory_delta(transaction, sebo_id, inventory_delta(added=[(categories, copy_data)], new_titles=new_titles))
+        bump_version(transaction, sebo_id, "books")
     try:
-        save_book_transaction(transaction, book_ref, copy, book_exists)
+        save_book_transaction(transaction, book_ref, copy)
+        invalidate_books(sebo_id, [ISBN])
+        schedule_stock_fold([book_ref])
         return {
             "ISBN": ISBN,
             "title": book_data.get('title'),
@@ -62,33 +101,48 @@ def add_manual_book(sebo_id, book_data, inventory_data):
     if not book_data.get('title'):
         raise BadRequest("Invalid book data: Missing title")
     
-    sebo_ref = db.collection('Sebos').document(sebo_id)
-    if not sebo_ref.get().exists:
-        raise NotFound(f"Sebo with ID {sebo_id} not found")
-    
-    book_ref = sebo_ref.collection('Books').document(ISBN)
-    book_doc = book_ref.get()
-    book_exists = book_doc.exists
+    # o sebo_id vem da claim do token verificado, nao precisa ler o documento do sebo
+    book_ref = db.collection('Sebos').document(sebo_id).collection('Books').document(ISBN)
     
     transaction = db.transaction()
     @firestore.transactional
-    def add_manual_book_transaction(transaction, book_ref, copy, book_exists):
-        if not book_exists:
+    def add_manual_book_transaction(transaction, book_ref, copy):
+        book_doc = book_ref.get(field_paths=_stock_read_fields(), transaction=transaction)
+        copy_ref = book_ref.collection('Copies').document()
+        copy_data = copy.model_dump(by_alias=True, exclude={'copyId'})
+        copy_data['copyId'] = copy_ref.id
+        if not book_doc.exists:
             book_data['totalQuantity'] = 1
             book_data['ISBN'] = book_ref.id
             # Validate complete book model
             book = Book.model_validate(book_data)
-            transaction.set(book_ref, book.model_dump(by_alias=True, exclude={'copies'}))
+            book_dump = book.model_dump(by_alias=True, exclude={'copies'})
+            book_dump.update(copy_summary_fields([copy_summary(copy_data)]))
+            transaction.set(book_ref, book_dump)
+            index_book(transaction, sebo_id, book_dump)
+            categories = book_dump.get('categories')
+            new_titles = [categories]
+        elif sharded_stock(): # o livro so e lido; a copia entra num shard do estoque
+            stored = book_doc.to_dict()
+            record_stock_delta(transaction, book_ref, added=[copy_summary(copy_data)])
+            categories = stored.get('categories')
+            new_titles = []
         else:
-            transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(1)})
+            stored = book_doc.to_dict()
+            summaries = load_copy_summaries(book_ref, stored, transaction) + [copy_summary(copy_data)]
+            transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(1),
+                                          **copy_summary_fields(summaries)})
+            categories = stored.get('categories')
+            new_titles = []
         
-        copy_ref = book_ref.collection('Copies').document()
-        copy_data = copy.model_dump(by_alias=True, exclude={'copyId'})
-        copy_data['copyId'] = copy_ref.id  
         transaction.set(copy_ref, copy_data)
+        apply_inventory_delta(transaction, sebo_id, inventory_delta(added=[(categories, copy_data)], new_titles=new_titles))
+        bump_version(transaction, sebo_id, "books")
     
     try:
-        add_manual_book_transaction(transaction, book_ref, copy, book_exists)
+        add_manual_book_transaction(transaction, book_ref, copy)
+        invalidate_books(sebo_id, [ISBN])
+        schedule_stock_fold([book_ref])
         return {
             "ISBN": ISBN,
             "title": book_data.get('title'),
@@ -99,132 +153,162 @@ def add_manual_book(sebo_id, book_data, inventory_data):
     except Exception as e:
         raise BadRequest(f"Data was not modified: failed to add manual book: {e}")
 
-def fetch_book(sebo_id, ISBN):
+def _book_ref(sebo_id, ISBN):
     if not ISBN:
         raise BadRequest("Invalid book data: Missing ISBN")
     if not sebo_id:
         raise BadRequest("Invalid book data: Missing Sebo ID")
-
-    sebo_ref = db.collection('Sebos').document(sebo_id)
-    if not sebo_ref.get().exists:
-        raise NotFound(f"Sebo with ID {sebo_id} not found")
-    
     ISBN = sanitize_isbn(ISBN)
     if not ISBN or len(ISBN) != 13:
         raise BadRequest("Invalid book data: Missing or invalid ISBN-13")
-    books_coll = sebo_ref.collection('Books')
-    book_ref = books_coll.document(ISBN)
+    return db.collection('Sebos').document(sebo_id).collection('Books').document(ISBN)
+
+def fetch_book(sebo_id, ISBN):
+    book_ref = _book_ref(sebo_id, ISBN)
+    return cached_book(sebo_id, book_ref.id, lambda: _load_book(book_ref))
+
+def _load_book(book_ref):
     book_doc = book_ref.get()
     if not book_doc.exists:
-        raise NotFound(f"Book with ISBN {ISBN} not found")
+        raise NotFound(f"Book with ISBN {book_ref.id} not found")
     book_data = book_doc.to_dict()
-    copies_ref = book_ref.collection('Copies')
-    copies = [copy.to_dict() for copy in copies_ref.stream()]
+    if sharded_stock():
+        shard_docs = fetch_stock_shards(book_ref)
+        if shard_docs:
+            book_data.update(merge_stock_shards(book_ref, book_data, shard_docs))
+            schedule_stock_fold([book_ref]) # shards de outro worker que nao chegou a dobrar
+    copies = book_data.pop('copySummaries', None)
+    if copies is None: # livro anterior a denormalizacao
+        copies = [copy.to_dict() for copy in book_ref.collection('Copies').stream()]
     book_data['copies'] = copies
     return book_data
     
 def update_book(sebo_id, ISBN, copy_id, update_data):
-    if not ISBN:
-        raise BadRequest("Invalid book data: Missing ISBN")
     if not copy_id:
         raise BadRequest("Invalid book data: Missing copyID")
-    if not sebo_id:
-        raise BadRequest("Invalid book data: Missing Sebo ID")
-    
-    sebo_ref = db.collection('Sebos').document(sebo_id)
-    if not sebo_ref.get().exists:
-        raise NotFound(f"Sebo with ID {sebo_id} not found")
+    book_ref = _book_ref(sebo_id, ISBN)
+    copies_ref = book_ref.collection('Copies')
 
-    ISBN = sanitize_isbn(ISBN)
-    if not ISBN or len(ISBN) != 13:
-        raise BadRequest("Invalid book data: Missing or invalid ISBN-13")
-    books_coll = sebo_ref.collection('Books')
-    book_ref = books_coll.document(ISBN)
-    book_doc = book_ref.get()
-    if not book_doc.exists:
-        raise NotFound(f"Book with ISBN {ISBN} not found")
-    
-    copy_ref = book_ref.collection('Copies').document(copy_id)
-    if not copy_ref.get().exists:
-        raise NotFound(f"Copy with ID {copy_id} not found")
-    
-    copy_data = copy_ref.get().to_dict()
-    if not copy_data:
-        raise NotFound(f"Could not retrieve data from this {copy_id}")
+    transaction = db.transaction()
+    @firestore.transactional
+    def update_book_transaction(transaction):
+        # livro + copias lidos uma vez: a mesma leitura valida a copia e monta a resposta
+        book_doc = book_ref.get(transaction=transaction)
+        if not book_doc.exists:
+            raise NotFound(f"Book with ISBN {book_ref.id} not found")
+        copies = {copy.id: copy.to_dict() for copy in copies_ref.stream(transaction=transaction)}
+        shard_docs = fetch_stock_shards(book_ref, transaction) if sharded_stock() else []
+        if copy_id not in copies:
+            raise NotFound(f"Copy with ID {copy_id} not found")
 
-    copy_data.update(update_data)
-    try:
-        updated_copy = Copy.model_validate(copy_data)
+        copy_data = dict(copies[copy_id], **update_data)
+        try:
+            updated_copy = Copy.model_validate(copy_data)
+        except ValidationError as e:
+            raise BadRequest(f"Invalid update data: {e}")
         update_payload = updated_copy.model_dump(by_alias=True)
-        copy_ref.update(update_payload)
-    except ValidationError as e:
-        raise BadRequest(f"Invalid update data: {e}")
+        book_data = book_doc.to_dict()
+        transaction.update(copies_ref.document(copy_id), update_payload)
+        categories = book_data.get('categories')
+        apply_inventory_delta(transaction, sebo_id, inventory_delta(
+            added=[(categories, update_payload)], removed=[(categories, copies[copy_id])]))
+        copies[copy_id] = update_payload
+        summary_fields = copy_summary_fields([copy_summary(copy_data) for copy_data in copies.values()])
+        if shard_docs: # as copias lidas ja incluem os shards: dobra junto
+            summary_fields['totalQuantity'] = len(copies)
+            delete_stock_shards(transaction, shard_docs)
+        transaction.update(book_ref, summary_fields)
+        bump_version(transaction, sebo_id, "books")
 
-    return fetch_book(sebo_id, ISBN)
+        book_data.update(summary_fields)
+        book_data.pop('copySummaries')
+        book_data['copies'] = list(copies.values())
+        return book_data
+    try:
+        book = update_book_transaction(transaction)
+        invalidate_books(sebo_id, [book_ref.id])
+        return book
+    except (NotFound, BadRequest):
+        raise
+    except Exception as e:
+        raise BadRequest(f"Data was not modified: failed to update copy: {e}")
 
 def delete_book(sebo_id, ISBN): 
-    if not ISBN:
-        raise BadRequest("Invalid book data: Missing ISBN")
-    if not sebo_id:
-        raise BadRequest("Invalid book data: Missing Sebo ID")
-    
-    sebo_ref = db.collection('Sebos').document(sebo_id)
-    if not sebo_ref.get().exists:
-        raise NotFound(f"Sebo with ID {sebo_id} not found")
-    ISBN = sanitize_isbn(ISBN)
-    if not ISBN or len(ISBN) != 13:
-        raise BadRequest("Invalid book data: Missing or invalid ISBN-13")
-    book_ref = sebo_ref.collection('Books').document(ISBN)
-    book_doc = book_ref.get()
+    book_ref = _book_ref(sebo_id, ISBN)
+    # campos indexados sao necessarios para remover o livro do indice de busca
+    book_doc = book_ref.get(field_paths=['isbn', *FIELD_WEIGHTS])
     if not book_doc.exists:
-        raise NotFound(f"Book with ISBN {ISBN} not found")
-    
-    batch = db.batch()
+        raise NotFound(f"Book with ISBN {book_ref.id} not found")
+    book_data = dict(book_doc.to_dict(), isbn=book_ref.id)
+
     copies_ref = book_ref.collection('Copies')
-    copies = list(copies_ref.stream()) # deletando as copias pra limpar a entidade o livro inteiro
-    for copy in copies:
-        batch.delete(copies_ref.document(copy.id))
-    
+    # preco e estado das copias saem do resumo do estoque junto com o livro
+    copies = list(copies_ref.select(['price', 'conservationState']).stream())
+    shard_docs = fetch_stock_shards(book_ref) if sharded_stock() else []
+
+    # livro, resumo e versao no primeiro commit; shards, indice e copias vem depois, sem
+    # passar de BATCH_LIMIT escritas por commit (um titulo longo sozinho gera muitos tokens)
+    operations = [("delete", shard.reference, None, {}) for shard in shard_docs]
+    unindex_book(_OperationRecorder(operations), sebo_id, book_data)
+    operations += [("delete", copy.reference, None, {}) for copy in copies]
+
+    batch = db.batch()
     batch.delete(book_ref)
+    categories = book_data.get('categories')
+    apply_inventory_delta(batch, sebo_id, inventory_delta(
+        removed=[(categories, copy.to_dict()) for copy in copies], removed_titles=[categories]))
+    bump_version(batch, sebo_id, "books")
+    pending = 3
+    for method, ref, payload, options in operations:
+        if pending >= BATCH_LIMIT:
+            batch.commit()
+            batch, pending = db.batch(), 0
+        if method == "delete":
+            batch.delete(ref)
+        else:
+            getattr(batch, method)(ref, payload, **options)
+        pending += 1
     batch.commit()
-    return {"ISBN": ISBN}
+    invalidate_books(sebo_id, [book_ref.id])
+    return {"ISBN": book_ref.id}
 
 def delete_copy(sebo_id, ISBN, copy_id):
-    if not ISBN:
-        raise BadRequest("Invalid book data: Missing ISBN")
-    if not sebo_id:
-        raise BadRequest("Invalid book data: Missing Sebo ID")
-    
-    sebo_ref = db.collection('Sebos').document(sebo_id)
-    if not sebo_ref.get().exists:
-        raise NotFound(f"Sebo with ID {sebo_id} not found")
-    ISBN = sanitize_isbn(ISBN)
-    if not ISBN or len(ISBN) != 13:
-        raise BadRequest("Invalid book data: Missing or invalid ISBN-13")
-    book_ref = sebo_ref.collection('Books').document(ISBN)
-    book_doc = book_ref.get()
-    if not book_doc.exists:
-        raise NotFound(f"Book with ISBN {ISBN} not found")
-    
+    book_ref = _book_ref(sebo_id, ISBN)
     copy_ref = book_ref.collection('Copies').document(copy_id)
-    if not copy_ref.get().exists:
-        raise NotFound(f"Copy with ID {copy_id} not found")
     
     transaction = db.transaction() 
     @firestore.transactional
     def delete_copy_transaction(transaction, book_ref, copy_ref):
+        # copia e livro (categorias) numa chamada so, para tirar a copia do resumo do estoque
+        snapshots = {doc.reference.path: doc for doc in transaction.get_all([book_ref, copy_ref])}
+        copy_doc = snapshots[copy_ref.path]
+        if not copy_doc.exists:
+            raise NotFound(f"Copy with ID {copy_id} not found")
+        book_data = snapshots[book_ref.path].to_dict() or {}
+        categories = book_data.get('categories')
+        if sharded_stock():
+            record_stock_delta(transaction, book_ref, removed=[copy_id])
+        else: # leitura (livros antigos sem copySummaries) antes de qualquer escrita da transaction
+            summaries = [summary for summary in load_copy_summaries(book_ref, book_data, transaction)
+                         if summary.get('copyId') != copy_id]
+            transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(-1),
+                                          **copy_summary_fields(summaries)})
         transaction.delete(copy_ref)
-        transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(-1)})
+        apply_inventory_delta(transaction, sebo_id, inventory_delta(removed=[(categories, copy_doc.to_dict())]))
+        bump_version(transaction, sebo_id, "books")
     try:
         delete_copy_transaction(transaction, book_ref, copy_ref)
-        return {"ISBN": ISBN, "copyID": copy_id}
+        invalidate_books(sebo_id, [book_ref.id])
+        schedule_stock_fold([book_ref])
+        return {"ISBN": book_ref.id, "copyID": copy_id}
+    except NotFound:
+        raise
     except Exception as e:
         raise BadRequest(f"Data was not modified: failed to delete copy: {e}")
 
+
 def fetch_all_books(sebo_id):
-    books_ref = db.collection('Sebos').document(sebo_id).collection('Books').select(
-        ['title', 'authors', 'categories', 'totalQuantity', 'isbn']
-    )
+    books_ref = db.collection('Sebos').document(sebo_id).collection('Books').select(BOOK_LIST_FIELDS)
     books_docs = books_ref.stream()
     books = []
     for book_doc in books_docs:
@@ -232,4 +316,227 @@ def fetch_all_books(sebo_id):
         books.append(data)
     return books
 
-       
\ No newline at end of file
+def fetch_books_page(sebo_id, limit, start_after=None, category=None, author=None,
+                     min_quantity=None, max_quantity=None):
+    if category and author:
+        raise BadRequest("Filters category and author cannot be combined") # firestore aceita so um array_contains por query
+    if min_quantity is not None and max_quantity is not None and min_quantity > max_quantity:
+        raise BadRequest("minQuantity cannot be greater than maxQuantity")
+
+    query = db.collection('Sebos').document(sebo_id).collection('Books').select(BOOK_LIST_FIELDS)
+    if category:
+        query = query.where('categories', 'array_contains', category)
+    if author:
+        query = query.where('authors', 'array_contains', author)
+
+    # filtro de intervalo exige que o primeiro order_by seja no mesmo campo
+    if min_quantity is not None or max_quantity is not None:
+        sort_field = 'totalQuantity'
+        if min_quantity is not None:
+            query = query.where('totalQuantity', '>=', min_quantity)
+        if max_quantity is not None:
+            query = query.where('totalQuantity', '<=', max_quantity)
+    else:
+        sort_field = 'title'
+    query = query.order_by(sort_field).order_by('__name__')
+
+    cursor = decode_page_token(start_after)
+    if cursor:
+        if set(cursor) != {sort_field, '__name__'}:
+            raise BadRequest("startAfter token does not match the requested filters")
+        query = query.start_after(cursor)
+
+    book_docs = list(query.limit(limit + 1).stream())
+    has_more = len(book_docs) > limit
+    book_docs = book_docs[:limit]
+
+    books = [book_doc.to_dict() for book_doc in book_docs]
+    next_token = None
+    if has_more:
+        last = book_docs[-1]
+        next_token = encode_page_token({sort_field: last.get(sort_field), '__name__': last.id})
+    return {"books": books, "nextPageToken": next_token}
+
+def parse_bulk_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or "ISBN" not in reader.fieldnames:
+        raise BadRequest("CSV must have a header row with at least the ISBN column")
+    return [dict(row) for row in reader]
+
+class _OperationRecorder:
+    """Guarda as escritas de index_book/unindex_book para agrupa-las nos batches."""
+
+    def __init__(self, operations):
+        self.operations = operations
+
+    def set(self, ref, payload, **options):
+        self.operations.append(("set", ref, payload, options))
+
+def _chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def bulk_save_books(sebo_id, rows):
+    if not isinstance(rows, list) or not rows:
+        raise BadRequest("Invalid bulk data: expected a non-empty list of rows")
+    if len(rows) > BULK_MAX_ROWS:
+        raise BadRequest(f"Invalid bulk data: at most {BULK_MAX_ROWS} rows per request")
+
+    results = [None] * len(rows)
+    candidates = [] # (indice da linha, ISBN, dados da copia) validados juntos depois do loop
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {"row": index, "status": "error", "error": "Row must be an object"}
+            continue
+        ISBN = sanitize_isbn(row.get("ISBN", ""))
+        if not ISBN or len(ISBN) != 13:
+            results[index] = {"row": index, "ISBN": row.get("ISBN"), "status": "error",
+                              "error": "Missing or invalid ISBN-13"}
+            continue
+        inventory_data = {"price": row.get("price") or 0.0}
+        if row.get("conservationState"):
+            inventory_data["conservation_state"] = row.get("conservationState")
+        candidates.append((index, ISBN, inventory_data))
+
+    # todas as copias numa chamada ao TypeAdapter; com erro, marca as linhas invalidas
+    # (loc comeca pela posicao na lista) e valida de novo so as restantes
+    try:
+        copies = COPY_ADAPTER.validate_many([data for _, _, data in candidates])
+    except ValidationError as e:
+        failed = {}
+        for error in e.errors():
+            failed.setdefault(error['loc'][0], error.get('msg'))
+        for position, message in failed.items():
+            index, ISBN, _ = candidates[position]
+            results[index] = {"row": index, "ISBN": ISBN, "status": "error",
+                              "error": f"Invalid inventory data: {message}"}
+        candidates = [candidate for position, candidate in enumerate(candidates) if position not in failed]
+        copies = COPY_ADAPTER.validate_many([data for _, _, data in candidates])
+    copies_by_isbn = {} # ISBN -> [(indice da linha, Copy)]
+    for (index, ISBN, _), copy in zip(candidates, copies):
+        copies_by_isbn.setdefault(ISBN, []).append((index, copy))
+
+    books_coll = db.collection('Sebos').document(sebo_id).collection('Books')
+    book_refs = {ISBN: books_coll.document(ISBN) for ISBN in copies_by_isbn}
+    existing = {} # ISBN -> categorias e copias ja denormalizadas
+    for refs in _chunked(list(book_refs.values()), BATCH_LIMIT):
+        for book_doc in db.get_all(refs, field_paths=['totalQuantity', 'categories', 'copySummaries']):
+            if book_doc.exists:
+                existing[book_doc.id] = book_doc.to_dict()
+
+    # so busca metadados na Google Books para livros que o sebo ainda nao tem
+    metadata = fetch_books_by_isbn([ISBN for ISBN in copies_by_isbn if ISBN not in existing])
+    new_books = {}
+    for ISBN, book_data in metadata.items():
+        error = None
+        if isinstance(book_data, Exception):
+            error = "Google Books API temporarily unavailable"
+        elif not book_data:
+            error = f"Book with ISBN {ISBN} not found via Google Books API"
+        else:
+            book_data['ISBN'] = ISBN
+            book_data['totalQuantity'] = 0
+            try:
+                new_books[ISBN] = Book.model_validate(book_data).model_dump(by_alias=True, exclude={'copies'})
+            except ValidationError as e:
+                error = f"Invalid book data: {e.errors()[0].get('msg')}"
+        if error:
+            for index, _ in copies_by_isbn.pop(ISBN):
+                results[index] = {"row": index, "ISBN": ISBN, "status": "error", "error": error}
+
+    # cada grupo = escrita do livro + copias, para o contador andar junto com as copias no mesmo commit
+    groups = []
+    for ISBN, copies in copies_by_isbn.items():
+        book_ref = book_refs[ISBN]
+        if ISBN in new_books:
+            categories, known = new_books[ISBN].get('categories'), []
+        else:
+            categories, known = existing[ISBN].get('categories'), load_copy_summaries(book_ref, existing[ISBN])
+        legacy = ISBN in existing and 'copySummaries' not in existing[ISBN] # lista montada da subcolecao
+        remaining = copies
+        first_chunk = True
+        while remaining:
+            operations = []
+            new_titles = []
+            if ISBN in new_books and first_chunk:
+                # livro novo: documento + entradas do indice de busca no mesmo commit
+                operations.append(("set", book_ref, new_books[ISBN], {}))
+                index_book(_OperationRecorder(operations), sebo_id, new_books[ISBN])
+                new_titles.append(categories)
+            else:
+                operations.append(("update", book_ref, None, {}))
+            first_chunk = False
+            room = BATCH_LIMIT - 2 - len(operations) # 2 escritas reservadas: versao e resumo do estoque
+            chunk, remaining = remaining[:room], remaining[room:]
+            row_refs = []
+            added = []
+            for index, copy in chunk:
+                copy_ref = book_ref.collection('Copies').document()
+                copy_data = copy.model_dump(by_alias=True, exclude={'copyId'})
+                copy_data['copyId'] = copy_ref.id
+                operations.append(("set", copy_ref, copy_data, {}))
+                row_refs.append((index, ISBN, copy_ref.id))
+                added.append((categories, copy_data))
+            chunk_summaries = [copy_summary(copy_data) for _, copy_data in added]
+            known += chunk_summaries
+            summary_fields = copy_summary_fields(known)
+            method, ref, payload, options = operations[0]
+            if method == "update" and sharded_stock():
+                operations[0] = ("set", *stock_shard_write(ref, added=chunk_summaries), {"merge": True})
+            elif method == "set":
+                operations[0] = (method, ref, dict(payload, totalQuantity=len(chunk), **summary_fields), options)
+            elif legacy:
+                # livro sem copySummaries: um ArrayUnion criaria a lista so com as copias novas
+                operations[0] = (method, ref, dict(summary_fields, totalQuantity=firestore.firestore.Increment(len(chunk))), options)
+            else:
+                # sem transaction: ArrayUnion/Minimum/Maximum nao perdem copias gravadas em paralelo;
+                # a media usa a lista lida e a proxima transaction do livro recalcula tudo
+                operations[0] = (method, ref, {
+                    "totalQuantity": firestore.firestore.Increment(len(chunk)),
+                    "copySummaries": firestore.firestore.ArrayUnion(chunk_summaries),
+                    "minPrice": firestore.firestore.Minimum(min(summary['price'] for summary in chunk_summaries)),
+                    "maxPrice": firestore.firestore.Maximum(max(summary['price'] for summary in chunk_summaries)),
+                    "avgPrice": summary_fields['avgPrice'],
+                }, options)
+            groups.append((operations, row_refs, added, new_titles))
+
+    pending_ops, pending_rows, pending_added, pending_titles = [], [], [], []
+    def commit_pending():
+        if not pending_ops:
+            return
+        batch = db.batch()
+        for method, ref, payload, options in pending_ops:
+            getattr(batch, method)(ref, payload, **options)
+        apply_inventory_delta(batch, sebo_id, inventory_delta(added=pending_added, new_titles=pending_titles))
+        bump_version(batch, sebo_id, "books")
+        try:
+            batch.commit()
+            for index, ISBN, copy_id in pending_rows:
+                results[index] = {"row": index, "ISBN": ISBN, "status": "created", "copyId": copy_id}
+        except Exception as e:
+            for index, ISBN, _ in pending_rows:
+                results[index] = {"row": index, "ISBN": ISBN, "status": "error",
+                                  "error": f"Data was not modified: failed to save batch: {e}"}
+        invalidate_books(sebo_id, [ISBN for _, ISBN, _ in pending_rows]) # o commit pode ter falhado depois de gravar
+        schedule_stock_fold([book_refs[ISBN] for ISBN in {ISBN for _, ISBN, _ in pending_rows}])
+        pending_ops.clear()
+        pending_rows.clear()
+        pending_added.clear()
+        pending_titles.clear()
+
+    for operations, row_refs, added, new_titles in groups:
+        if len(pending_ops) + len(operations) > BATCH_LIMIT - 2:
+            commit_pending()
+        pending_ops.extend(operations)
+        pending_rows.extend(row_refs)
+        pending_added.extend(added)
+        pending_titles.extend(new_titles)
+    commit_pending()
+
+    created = sum(1 for result in results if result["status"] == "created")
+    return {
+        "total": len(rows),
+        "created": created,
+        "failed": len(rows) - created,
+        "results": results,
+    }
@@ -0,0 +1,74 @@
+from firebase_admin import firestore
+from services.firebase_client import db
+import os
+import random
+
+
+# Contadores por sebo (versoes, resumo do estoque, stats de vendas) recebem escrita de quase
+# toda transaction do sebo. Para nao virarem um documento disputado, cada escrita soma num
+# shard sorteado {doc}/Shards/{0..COUNTER_SHARDS-1}; a leitura soma o documento base (valores
+# anteriores aos shards ou gravados por um rebuild) com os shards numa so chamada get_all.
+# COUNTER_SHARDS so pode aumentar: shards acima do valor atual deixariam de ser lidos.
+COUNTER_SHARDS = int(os.getenv("COUNTER_SHARDS", "4"))
+
+
+def to_increments(values):
+    """Converte um delta aninhado de contadores em Increments para um set(merge=True); zeros sao omitidos."""
+    increments = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            nested = to_increments(value)
+            if nested:
+                increments[key] = nested
+        elif isinstance(value, (int, float)):
+            if value:
+                increments[key] = firestore.firestore.Increment(value)
+        else:
+            increments[key] = value
+    return increments
+
+
+def _shard_refs(doc_ref):
+    shards = doc_ref.collection('Shards')
+    return [shards.document(str(index)) for index in range(COUNTER_SHARDS)]
+
+
+def increment_counter(writer, doc_ref, delta):
+    """Soma `delta` num shard sorteado do contador; `writer` pode ser uma transaction ou um batch."""
+    increments = to_increments(delta)
+    if increments:
+        shard_ref = doc_ref.collection('Shards').document(str(random.randrange(COUNTER_SHARDS)))
+        writer.set(shard_ref, increments, merge=True)
+
+
+def _add_counters(total, values):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            _add_counters(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+        else: # textos (ex.: nome do vendedor) e flags ficam com qualquer um dos valores
+            total[key] = value
+
+
+def read_counter(doc_ref, field_paths=None):
+    """Documento base somado aos shards; None se nenhum dos dois existe."""
+    total, found = {}, False
+    for snapshot in db.get_all([doc_ref, *_shard_refs(doc_ref)], field_paths=field_paths):
+        if snapshot.exists:
+            found = True
+            _add_counters(total, snapshot.to_dict() or {})
+    return total if found else None
+
+
+def reset_counter(doc_ref, values):
+    """Grava `values` no documento base e apaga os shards num batch (usado pelos rebuilds).
+
+    Escritas concorrentes entre a leitura que gerou `values` e este commit se perdem; os
+    rebuilds devem rodar com o sebo parado.
+    """
+    batch = db.batch()
+    batch.set(doc_ref, values)
+    for shard_ref in _shard_refs(doc_ref):
+        batch.delete(shard_ref)
+    batch.commit()
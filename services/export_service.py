@@ -0,0 +1,95 @@
+from services.firebase_client import db
+from models.books import Book
+from models.sales import Sales
+from models.alteration_log import AlterationLog
+import csv
+import io
+import json
+
+
+EXPORT_PAGE_SIZE = 1000 # documentos por query; cada pagina e uma chamada stream() curta
+EXPORT_FLUSH_SIZE = 64 * 1024 # bytes acumulados antes de mandar um pedaco da resposta
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _columns(model, exclude=()):
+    return [field.alias or name for name, field in model.model_fields.items() if name not in exclude]
+
+
+EXPORTS = {
+    "books": (lambda sebo_id: db.collection('Sebos').document(sebo_id).collection('Books'),
+              _columns(Book, exclude={'copies', 'copy_summaries'})),
+    "sales": (lambda sebo_id: db.collection('Sales').document(sebo_id).collection('saleId'),
+              _columns(Sales)),
+    "logs": (lambda sebo_id: db.collection('Sebos').document(sebo_id).collection('AlterationLogs'),
+             _columns(AlterationLog)),
+}
+
+
+def stream_snapshots(query, page_size=EXPORT_PAGE_SIZE):
+    """Percorre a colecao inteira em paginas por __name__, sem guardar mais que uma pagina."""
+    query = query.order_by('__name__').limit(page_size)
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc is not None else query
+        count = 0
+        for doc in page.stream():
+            count += 1
+            last_doc = doc
+            yield doc
+        if count < page_size:
+            return
+
+
+def stream_documents(query, page_size=EXPORT_PAGE_SIZE):
+    for doc in stream_snapshots(query, page_size):
+        yield doc.to_dict()
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "; ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def _csv_lines(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_csv_value(row.get(column)) for column in columns])
+        yield buffer.getvalue()
+
+
+def _buffered(lines, flush_size=EXPORT_FLUSH_SIZE):
+    # a primeira linha sai na hora; depois junta pedacos para nao mandar um chunk por documento
+    chunk, size, first = [], 0, True
+    for line in lines:
+        encoded = line.encode("utf-8")
+        chunk.append(encoded)
+        size += len(encoded)
+        if first or size >= flush_size:
+            yield b"".join(chunk)
+            chunk, size, first = [], 0, False
+    if chunk:
+        yield b"".join(chunk)
+
+
+def export_collection(sebo_id, kind, export_format="ndjson"):
+    """Gera os bytes do export de `kind` (books, sales ou logs) em NDJSON ou CSV."""
+    collection_for, columns = EXPORTS[kind]
+    rows = stream_documents(collection_for(sebo_id))
+    lines = _csv_lines(rows, columns) if export_format == "csv" else _ndjson_lines(rows)
+    return _buffered(lines)
@@ -0,0 +1,66 @@
+from firebase_admin import credentials, firestore
+import firebase_admin
+import base64
+import json
+import os
+import threading
+
+
+# credenciais, app do firebase_admin e client do Firestore so sao criados no primeiro uso,
+# ja dentro do worker: importar o app (boot do gunicorn, `flask` CLI, build da spec) nao
+# decodifica a service account nem abre canal gRPC.
+_lock = threading.RLock()
+_client = None
+
+
+def _load_credentials():
+    sa_b64 = os.environ.get('FIREBASE_SERVICE_ACCOUNT_BASE64')
+    if sa_b64:
+        try:
+            sa_json = json.loads(base64.b64decode(sa_b64).decode('utf-8'))
+            return credentials.Certificate(sa_json)
+        except Exception as e:
+            raise RuntimeError('Failed to parse FIREBASE_SERVICE_ACCOUNT_BASE64') from e
+    path = os.getenv('GOOGLE_APLICATION_CREDENTIALS') or os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+    if not path:
+        raise RuntimeError('Firebase service account not configured. Set FIREBASE_SERVICE_ACCOUNT_BASE64 or GOOGLE_APLICATION_CREDENTIALS')
+    return credentials.Certificate(path)
+
+
+def credentials_configured():
+    # checagem barata (sem decodificar nada) para o worker falhar no boot com configuracao faltando
+    return bool(os.environ.get('FIREBASE_SERVICE_ACCOUNT_BASE64') or os.getenv('GOOGLE_APLICATION_CREDENTIALS')
+                or os.getenv('GOOGLE_APPLICATION_CREDENTIALS'))
+
+
+def get_firebase_app():
+    """App padrao do firebase_admin; inicializa na primeira chamada se ninguem inicializou antes."""
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        pass
+    with _lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            return firebase_admin.initialize_app(_load_credentials())
+
+
+def get_db():
+    """Client do Firestore compartilhado por todos os services."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = firestore.client(get_firebase_app())
+    return _client
+
+
+class _LazyClient:
+    """`db` dos services: repassa cada atributo ao client, criado no primeiro acesso."""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+
+db = _LazyClient()
@@ -1,13 +1,56 @@
 import os
+import copy
+import threading
 import requests
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from services.firebase_client import db
+from werkzeug.exceptions import HTTPException
+from services.cache_utils import TTLCache
+from services.http_utils import build_session, CircuitBreaker
 from services.isbn_utils import sanitize_isbn
+from services.metrics_service import GOOGLE_BOOKS_LATENCY
+import time
 
 
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_BOOKS_API_KEY")
-BASE_URL = "https://www.googleapis.com/books/v1/volumes"
+BASE_URL = os.getenv("GOOGLE_BOOKS_BASE_URL", "https://www.googleapis.com/books/v1/volumes")
+
+GOOGLE_BOOKS_POOL_SIZE = int(os.getenv("GOOGLE_BOOKS_POOL_SIZE", "10"))
+GOOGLE_BOOKS_CONNECT_TIMEOUT = float(os.getenv("GOOGLE_BOOKS_CONNECT_TIMEOUT", "3.05"))
+GOOGLE_BOOKS_READ_TIMEOUT = float(os.getenv("GOOGLE_BOOKS_READ_TIMEOUT", "10"))
+GOOGLE_BOOKS_MAX_RETRIES = int(os.getenv("GOOGLE_BOOKS_MAX_RETRIES", "3"))
+GOOGLE_BOOKS_BACKOFF = float(os.getenv("GOOGLE_BOOKS_BACKOFF", "0.5"))
+GOOGLE_BOOKS_BREAKER_THRESHOLD = int(os.getenv("GOOGLE_BOOKS_BREAKER_THRESHOLD", "5"))
+GOOGLE_BOOKS_BREAKER_COOLDOWN = float(os.getenv("GOOGLE_BOOKS_BREAKER_COOLDOWN", "30"))
+
+_session = build_session(
+    pool_size=GOOGLE_BOOKS_POOL_SIZE,
+    max_retries=GOOGLE_BOOKS_MAX_RETRIES,
+    backoff_factor=GOOGLE_BOOKS_BACKOFF,
+)
+_breaker = CircuitBreaker(
+    "Google Books API",
+    threshold=GOOGLE_BOOKS_BREAKER_THRESHOLD,
+    cooldown=GOOGLE_BOOKS_BREAKER_COOLDOWN,
+)
+
+# cache em dois niveis: LRU em memoria por worker + colecao global IsbnCatalog
+# compartilhada entre workers e sebos. Resultados "nao encontrado" tambem sao
+# guardados, por menos tempo.
+ISBN_CACHE_SIZE = int(os.getenv("ISBN_CACHE_SIZE", "2048"))
+ISBN_CACHE_TTL = float(os.getenv("ISBN_CACHE_TTL", "3600"))
+ISBN_NEGATIVE_TTL = float(os.getenv("ISBN_NEGATIVE_TTL", "600"))
+ISBN_CATALOG_TTL = float(os.getenv("ISBN_CATALOG_TTL", str(30 * 24 * 3600)))
+ISBN_CATALOG_NEGATIVE_TTL = float(os.getenv("ISBN_CATALOG_NEGATIVE_TTL", "3600"))
+
+_NOT_FOUND = object()
+_isbn_cache = TTLCache(maxsize=ISBN_CACHE_SIZE, ttl=ISBN_CACHE_TTL)
+_cache_counters = Counter()
+_counters_lock = threading.Lock()
 
 
 def _build_params(query: str) -> dict:
@@ -43,24 +86,143 @@ def _normalize_google_volume(ISBN: str, book_data: dict) -> dict:
     }
 
 
-def fetch_book_by_isbn(ISBN: str):
+def _count(event: str):
+    with _counters_lock:
+        _cache_counters[event] += 1
+
+
+def isbn_cache_stats() -> dict:
+    with _counters_lock:
+        stats = dict(_cache_counters)
+    for event in ("memoryHits", "catalogHits", "negativeHits", "misses"):
+        stats.setdefault(event, 0)
+    lookups = sum(stats.values())
+    stats["hitRatio"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+    stats["memoryEntries"] = len(_isbn_cache)
+    return stats
+
+
+def _read_catalog(ISBN: str):
     try:
-        original_isbn = sanitize_isbn(ISBN)
-        if not original_isbn or len(original_isbn) != 13:
-            return None
+        catalog_doc = db.collection('IsbnCatalog').document(ISBN).get()
+    except Exception as e:
+        print(f"Error reading IsbnCatalog: {str(e)}")
+        return None
+    if not catalog_doc.exists:
+        return None
+    entry = catalog_doc.to_dict()
+    found = entry.get("found", False)
+    ttl = ISBN_CATALOG_TTL if found else ISBN_CATALOG_NEGATIVE_TTL
+    try:
+        cached_at = datetime.fromisoformat(entry["cachedAt"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if (datetime.now(timezone.utc) - cached_at).total_seconds() > ttl:
+        return None
+    return entry.get("book") if found else _NOT_FOUND
 
-        query = f"isbn:{original_isbn}"
-        response = requests.get(BASE_URL, params=_build_params(query))
-        response.raise_for_status()
-        data = response.json() or {}
-        items = data.get("items") or []
-        if not items:
-            return None
-        return _normalize_google_volume(ISBN, items[0])
 
+def _write_catalog(ISBN: str, book):
+    try:
+        db.collection('IsbnCatalog').document(ISBN).set({
+            "found": book is not None,
+            "book": book,
+            "cachedAt": datetime.now(timezone.utc).isoformat(),
+        })
+    except Exception as e:
+        print(f"Error writing IsbnCatalog: {str(e)}")
+
+
+def _remember(ISBN: str, book):
+    if book is None or book is _NOT_FOUND:
+        _isbn_cache.set(ISBN, _NOT_FOUND, ttl=ISBN_NEGATIVE_TTL)
+    else:
+        _isbn_cache.set(ISBN, book)
+
+
+def _is_upstream_failure(error: Exception) -> bool:
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 or status == 429 # 4xx de requisicao invalida nao indica instabilidade
+    return isinstance(error, requests.RequestException)
+
+
+def _fetch_from_google(ISBN: str):
+    """Return the normalized volume, None if Google has no match; raises on transport errors."""
+    query = f"isbn:{ISBN}"
+    _breaker.before_call()
+    started = time.perf_counter()
+    try:
+        response = _session.get(
+            BASE_URL,
+            params=_build_params(query),
+            timeout=(GOOGLE_BOOKS_CONNECT_TIMEOUT, GOOGLE_BOOKS_READ_TIMEOUT),
+        )
+        response.raise_for_status()
     except Exception as e:
+        GOOGLE_BOOKS_LATENCY.observe(time.perf_counter() - started, "error")
+        if _is_upstream_failure(e):
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+        raise
+    _breaker.record_success()
+    data = response.json() or {}
+    items = data.get("items") or []
+    GOOGLE_BOOKS_LATENCY.observe(time.perf_counter() - started, "found" if items else "not_found")
+    if not items:
+        return None
+    return _normalize_google_volume(ISBN, items[0])
+
+
+def fetch_book_by_isbn(ISBN: str):
+    original_isbn = sanitize_isbn(ISBN)
+    if not original_isbn or len(original_isbn) != 13:
+        return None
+
+    cached = _isbn_cache.get(original_isbn)
+    if cached is _NOT_FOUND:
+        _count("negativeHits")
+        return None
+    if cached is not None:
+        _count("memoryHits")
+        return copy.deepcopy(cached) # save_book altera o dict recebido
+
+    cached = _read_catalog(original_isbn)
+    if cached is not None:
+        _count("negativeHits" if cached is _NOT_FOUND else "catalogHits")
+        _remember(original_isbn, cached)
+        return None if cached is _NOT_FOUND else copy.deepcopy(cached)
+
+    _count("misses")
+    try:
+        book = _fetch_from_google(original_isbn)
+    except HTTPException: # circuito aberto: falha rapido com 503
+        raise
+    except Exception as e: # erro de rede nao entra no cache negativo
         print(f"Error fetching book: {str(e)}")
         return None
+    _remember(original_isbn, book)
+    _write_catalog(original_isbn, book)
+    return copy.deepcopy(book)
+
+
+def fetch_books_by_isbn(ISBNs, max_workers=None) -> dict:
+    """Resolve several ISBNs concurrently; maps each ISBN to its volume, None or the raised error."""
+    unique_isbns = list(dict.fromkeys(ISBNs))
+    results = {}
+    if not unique_isbns:
+        return results
+    workers = min(max_workers or GOOGLE_BOOKS_POOL_SIZE, len(unique_isbns))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_book_by_isbn, ISBN): ISBN for ISBN in unique_isbns}
+        for future in as_completed(futures):
+            ISBN = futures[future]
+            try:
+                results[ISBN] = future.result()
+            except Exception as e:
+                results[ISBN] = e
+    return results
 
 
 def _extract_isbn_from_volume(volume: dict) -> str:
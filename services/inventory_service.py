@@ -0,0 +1,86 @@
+from services.firebase_client import db
+from services.counter_utils import increment_counter, read_counter, reset_counter
+from services.export_service import stream_snapshots
+from services.stock_service import sharded_stock
+
+
+# Sebos/{seboId}/Stats/inventory guarda o resumo do estoque (titulos, copias, valor e
+# quebras por estado de conservacao e categoria). Toda escrita que cria ou remove livros
+# e copias aplica a variacao no mesmo commit num dos shards do contador (counter_utils),
+# entao GET /books/summary le so o resumo. Estoques anteriores ao resumo precisam de um
+# `flask --app app rebuild-stats` uma vez.
+
+INVENTORY_GROUPS = ('byConservationState', 'byCategory')
+
+
+def _inventory_ref(sebo_id):
+    return db.collection('Sebos').document(sebo_id).collection('Stats').document('inventory')
+
+
+def inventory_delta(added=(), removed=(), new_titles=(), removed_titles=()):
+    """Variacao do resumo.
+
+    `added`/`removed` sao pares (categorias do livro, dados da copia); `new_titles` e
+    `removed_titles` sao as categorias de cada livro criado ou removido.
+    """
+    delta = {"totalTitles": 0, "totalCopies": 0, "totalValue": 0.0}
+    for sign, titles in ((1, new_titles), (-1, removed_titles)):
+        for categories in titles:
+            delta['totalTitles'] += sign
+            for category in categories or []:
+                bucket = delta.setdefault('byCategory', {}).setdefault(category, {"titles": 0, "copies": 0, "value": 0.0})
+                bucket['titles'] += sign
+    for sign, copies in ((1, added), (-1, removed)):
+        for categories, copy_data in copies:
+            price = float(copy_data.get('price') or 0.0) * sign
+            delta['totalCopies'] += sign
+            delta['totalValue'] += price
+            state = copy_data.get('conservationState')
+            if state:
+                bucket = delta.setdefault('byConservationState', {}).setdefault(state, {"copies": 0, "value": 0.0})
+                bucket['copies'] += sign
+                bucket['value'] += price
+            for category in categories or []:
+                bucket = delta.setdefault('byCategory', {}).setdefault(category, {"titles": 0, "copies": 0, "value": 0.0})
+                bucket['copies'] += sign
+                bucket['value'] += price
+    return delta
+
+
+def apply_inventory_delta(writer, sebo_id, delta):
+    """Soma `delta` ao resumo; `writer` pode ser uma transaction ou um batch."""
+    increment_counter(writer, _inventory_ref(sebo_id), delta)
+
+
+def _book_copies(book_doc):
+    book_data = book_doc.to_dict()
+    if 'copySummaries' in book_data and not sharded_stock(): # com shards a lista pode estar atrasada
+        return book_data['copySummaries']
+    copies_query = book_doc.reference.collection('Copies').select(['price', 'conservationState'])
+    return [copy.to_dict() for copy in copies_query.stream()]
+
+
+def rebuild_inventory_summary(sebo_id):
+    """Recalcula o resumo a partir dos livros, em paginas e fora de transaction (comando rebuild-stats)."""
+    books_query = db.collection('Sebos').document(sebo_id).collection('Books').select(['categories', 'copySummaries'])
+    titles, copies = [], []
+    for book_doc in stream_snapshots(books_query):
+        categories = book_doc.to_dict().get('categories') or []
+        titles.append(categories)
+        copies += [(categories, copy_data) for copy_data in _book_copies(book_doc)]
+    summary = inventory_delta(added=copies, new_titles=titles)
+    for group in INVENTORY_GROUPS:
+        summary.setdefault(group, {})
+    reset_counter(_inventory_ref(sebo_id), summary)
+    return summary
+
+
+def fetch_inventory_summary(sebo_id):
+    summary = read_counter(_inventory_ref(sebo_id)) or {}
+    summary.pop('initialized', None) # resumos gravados antes dos shards
+    summary = dict({"totalTitles": 0, "totalCopies": 0, "totalValue": 0.0}, **summary)
+    for group in INVENTORY_GROUPS:
+        summary.setdefault(group, {})
+    total_copies = summary.get('totalCopies', 0)
+    summary['averagePrice'] = summary.get('totalValue', 0.0) / total_copies if total_copies else 0.0
+    return summary
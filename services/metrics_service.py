@@ -0,0 +1,247 @@
+from flask import request, Response
+from contextvars import ContextVar
+from google.cloud.firestore_v1 import batch as batch_module
+from google.cloud.firestore_v1 import client as client_module
+from google.cloud.firestore_v1 import document as document_module
+from google.cloud.firestore_v1 import query as query_module
+from google.cloud.firestore_v1 import transaction as transaction_module
+from werkzeug.exceptions import Forbidden, Unauthorized
+import bisect
+import hmac
+import os
+import threading
+import time
+
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") # /metrics exige "Authorization: Bearer <token>"; sem ele fica fechado
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+FIRESTORE_OPERATIONS = ("reads", "writes", "transactions")
+
+# contadores do Firestore da requisicao atual; fora de uma requisicao (threads de fundo) fica None
+_request_ops = ContextVar("firestore_request_ops", default=None)
+
+
+class Histogram:
+    """Histograma com buckets fixos no formato do Prometheus, uma serie por conjunto de labels."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {} # labels -> [contagem por bucket..., +Inf], soma
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[labels] = (counts, total + value)
+
+    def quantile(self, q, counts):
+        """Estima o quantil interpolando dentro do bucket, como o histogram_quantile do Prometheus."""
+        observed = sum(counts)
+        if not observed:
+            return 0.0
+        rank = q * observed
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets): # caiu no +Inf: melhor estimativa e o maior limite
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le=_number(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le='+Inf')} {sum(counts)}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {sum(counts)}")
+        quantile_name = f"{self.name}_quantile"
+        lines += [f"# HELP {quantile_name} p50/p95/p99 estimated from {self.name} buckets",
+                  f"# TYPE {quantile_name} gauge"]
+        for labels, (counts, _) in sorted(series.items()):
+            for q in QUANTILES:
+                value = self.quantile(q, counts)
+                lines.append(f"{quantile_name}{_labels(self.label_names, labels, quantile=_number(q))} {_number(value)}")
+        return lines
+
+
+class CounterVec:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+REQUEST_LATENCY = Histogram("volta_http_request_duration_seconds", "HTTP request latency by route",
+                            ("method", "route", "status"))
+FIRESTORE_OPS = CounterVec("volta_firestore_operations_total",
+                           "Firestore document reads, written documents and committed transactions by route",
+                           ("method", "route", "operation"))
+GOOGLE_BOOKS_LATENCY = Histogram("volta_google_books_request_duration_seconds",
+                                 "Latency of outbound Google Books API calls", ("outcome",))
+AUTH_LATENCY = Histogram("volta_auth_verification_duration_seconds",
+                         "Firebase ID token verification time", ("result",),
+                         buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+_collectors = [] # (prefixo, funcao que devolve um dict de estatisticas)
+
+
+def register_stats(prefix, stats_function):
+    """Publica os valores numericos de `stats_function()` como gauges `volta_<prefix>{stat=...}`."""
+    _collectors.append((prefix, stats_function))
+
+
+def _record_firestore(operation, amount=1):
+    ops = _request_ops.get()
+    if ops is not None:
+        ops[operation] += amount
+    else:
+        FIRESTORE_OPS.inc(amount, "", "background", operation)
+
+
+def _counted_stream(iterator, minimum):
+    seen = 0
+    try:
+        for item in iterator:
+            seen += 1
+            yield item
+    finally:
+        _record_firestore("reads", max(seen, minimum)) # query sem resultado custa 1 leitura
+
+
+_firestore_instrumented = False
+
+
+def instrument_firestore():
+    """Envolve o client do Firestore (no nivel da classe, vale para o `db` de todos os services)."""
+    global _firestore_instrumented
+    if _firestore_instrumented:
+        return
+    _firestore_instrumented = True
+    original_get_all = client_module.Client.get_all
+    original_document_get = document_module.DocumentReference.get
+    original_stream = query_module.Query.stream
+    original_batch_commit = batch_module.WriteBatch.commit
+    original_tx_commit = transaction_module.Transaction._commit
+
+    def get_all(self, *args, **kwargs):
+        return _counted_stream(original_get_all(self, *args, **kwargs), minimum=0)
+
+    def document_get(self, *args, **kwargs):
+        _record_firestore("reads")
+        return original_document_get(self, *args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return _counted_stream(original_stream(self, *args, **kwargs), minimum=1)
+
+    def batch_commit(self, *args, **kwargs):
+        _record_firestore("writes", len(self._write_pbs))
+        return original_batch_commit(self, *args, **kwargs)
+
+    def tx_commit(self, *args, **kwargs):
+        _record_firestore("writes", len(self._write_pbs))
+        _record_firestore("transactions")
+        return original_tx_commit(self, *args, **kwargs)
+
+    client_module.Client.get_all = get_all
+    document_module.DocumentReference.get = document_get
+    query_module.Query.stream = stream
+    batch_module.WriteBatch.commit = batch_commit
+    transaction_module.Transaction._commit = tx_commit
+
+
+def render_metrics():
+    lines = []
+    for metric in (REQUEST_LATENCY, FIRESTORE_OPS, GOOGLE_BOOKS_LATENCY, AUTH_LATENCY):
+        lines += metric.render()
+    for prefix, stats_function in _collectors:
+        name = f"volta_{prefix}"
+        lines += [f"# HELP {name} Internal {prefix} statistics", f"# TYPE {name} gauge"]
+        for stat, value in sorted(stats_function().items()):
+            if isinstance(value, (int, float)):
+                lines.append(f'{name}{{stat="{_escape(stat)}"}} {_number(value)}')
+    return "\n".join(lines) + "\n"
+
+
+def _route_labels():
+    rule = request.url_rule.rule if request.url_rule is not None else "unmatched" # nunca o path cru: ISBNs e ids explodem a cardinalidade
+    return request.method, rule
+
+
+def init_metrics(app):
+    @app.before_request
+    def _start_request_metrics():
+        request._start_time = time.perf_counter()
+        request._ops_token = _request_ops.set({operation: 0 for operation in FIRESTORE_OPERATIONS})
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = getattr(request, "_start_time", None)
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        method, route = _route_labels()
+        REQUEST_LATENCY.observe(duration, method, route, str(response.status_code))
+        ops = _request_ops.get()
+        if ops is not None:
+            for operation, amount in ops.items():
+                if amount:
+                    FIRESTORE_OPS.inc(amount, method, route, operation)
+            _request_ops.reset(request._ops_token) # leituras de respostas em streaming contam como background
+        app.logger.info(f"Request: {request.method} {request.path} completed in {duration * 1000.0:.1f}ms")
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_route():
+        if not METRICS_TOKEN:
+            raise Forbidden("Metrics are disabled: METRICS_TOKEN is not set")
+        provided = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(provided, METRICS_TOKEN):
+            raise Unauthorized("Invalid metrics token")
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,88 @@
+from pydantic import TypeAdapter, ValidationError
+from typing import Annotated, List
+import os
+
+
+# validado na escrita, confiavel na leitura: todo documento gravado pelos services ja passou
+# pelo modelo, entao as leituras so projetam os campos (alias, com os defaults) em vez de
+# reconstruir o modelo e fazer o dump. TRUSTED_READS=0 volta ao model_validate + model_dump.
+TRUSTED_READS = os.getenv("TRUSTED_READS", "1") != "0"
+
+_MISSING = object()
+
+
+class ModelAdapter:
+    """Caminhos rapidos para um modelo pydantic com alias camelCase.
+
+    - validate_many/dump_many: um TypeAdapter de List[model] compilado uma vez valida ou
+      serializa o lote numa chamada so ao pydantic-core;
+    - project: leitura confiavel, monta o dict por alias sem construir o modelo;
+    - merge_update: valida apenas os campos alterados e aplica sobre o documento lido.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._rows = TypeAdapter(List[model])
+        self._fields = [(name, field.alias or name, field) for name, field in model.model_fields.items()]
+        self._keys = {} # nome ou alias -> (nome, alias)
+        for name, alias, _ in self._fields:
+            self._keys[name] = self._keys[alias] = (name, alias)
+        self._field_adapters = {}
+
+    def validate_many(self, rows):
+        """Valida uma lista de dicts; o `loc` de cada erro comeca pelo indice da linha."""
+        return self._rows.validate_python(rows)
+
+    def dump_many(self, instances):
+        return self._rows.dump_python(instances, by_alias=True)
+
+    def project(self, data):
+        """Documento gravado -> dict por alias, como model_dump; None se faltar campo obrigatorio."""
+        if not TRUSTED_READS:
+            try:
+                return self.model.model_validate(data).model_dump(by_alias=True)
+            except ValidationError:
+                return None
+        projected = {}
+        for name, alias, field in self._fields:
+            value = data.get(alias, _MISSING)
+            if value is _MISSING:
+                value = data.get(name, _MISSING)
+            if value is _MISSING:
+                if field.is_required():
+                    return None
+                value = field.get_default(call_default_factory=True)
+            projected[alias] = value
+        return projected
+
+    def _field_adapter(self, name):
+        adapter = self._field_adapters.get(name)
+        if adapter is None:
+            field = self.model.model_fields[name]
+            annotation = Annotated[field.annotation, *field.metadata] if field.metadata else field.annotation
+            adapter = self._field_adapters[name] = TypeAdapter(annotation)
+        return adapter
+
+    def validate_fields(self, update):
+        """Valida so os campos de `update` (por nome ou alias); chaves desconhecidas sao ignoradas."""
+        validated = {}
+        errors = []
+        for key, value in update.items():
+            if key not in self._keys:
+                continue
+            name, alias = self._keys[key]
+            try:
+                validated[alias] = self._field_adapter(name).validate_python(value)
+            except ValidationError as e:
+                errors += [dict(error, loc=(alias, *error['loc'])) for error in e.errors()]
+        if errors:
+            raise ValidationError.from_exception_data(self.model.__name__, errors)
+        return validated
+
+    def merge_update(self, stored, update):
+        """Documento atualizado (por alias): o gravado projetado + os campos validados de `update`."""
+        projected = self.project(stored)
+        if projected is None: # documento fora do modelo: valida tudo como antes
+            projected = self.model.model_validate(stored).model_dump(by_alias=True)
+        projected.update(self.validate_fields(update))
+        return projected
@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from werkzeug.exceptions import BadRequest
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def parse_limit(raw_limit, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if raw_limit in (None, ""):
+        return default
+    try:
+        limit = int(raw_limit)
+    except (TypeError, ValueError):
+        raise BadRequest("limit must be an integer")
+    if limit < 1:
+        raise BadRequest("limit must be greater than zero")
+    return min(limit, maximum)
+
+
+def encode_page_token(cursor: dict) -> str:
+    """Serializa os valores do order_by do ultimo documento da pagina num token opaco."""
+    raw = json.dumps(cursor, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token: str) -> dict:
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        cursor = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError):
+        raise BadRequest("Invalid startAfter token")
+    if not isinstance(cursor, dict):
+        raise BadRequest("Invalid startAfter token")
+    return cursor
+
+
+def parse_int_arg(args, name):
+    raw_value = args.get(name)
+    if raw_value in (None, ""):
+        return None
+    try:
+        return int(raw_value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{name} must be an integer")
+
+
+def parse_date_arg(args, name, end_of_day=False):
+    """Converte `YYYY-MM-DD` ou ISO-8601 para a string ISO em UTC usada nos documentos.
+
+    Com `end_of_day`, uma data sem horario vira o inicio do dia seguinte, para ser
+    usada como limite exclusivo (`<`).
+    """
+    raw_value = args.get(name)
+    if raw_value in (None, ""):
+        return None
+    try:
+        parsed = datetime.fromisoformat(raw_value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a date (YYYY-MM-DD) or an ISO-8601 datetime")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end_of_day and len(raw_value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.astimezone(timezone.utc).isoformat()
@@ -0,0 +1,86 @@
+from flask import request
+from flask.json.provider import JSONProvider, _default
+import gzip
+import os
+
+try:
+    import orjson
+except ImportError: # opcional: so e necessario com FAST_JSON=1
+    orjson = None
+
+try:
+    import brotli
+except ImportError: # sem brotli a negociacao cai para gzip
+    brotli = None
+
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024")) # bytes; 0 desliga a compressao
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4")) # qualidades altas sao lentas demais para respostas dinamicas
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"}
+
+
+class FastJSONProvider(JSONProvider):
+    """Provider JSON do Flask usando orjson, serializando direto para bytes.
+
+    Datas continuam no formato HTTP do provider padrao. As chaves saem na ordem de
+    insercao (a ordem dos campos dos modelos) em vez de ordenadas.
+    """
+
+    mimetype = "application/json"
+    sort_keys = False
+
+    def __init__(self, app):
+        if orjson is None:
+            raise RuntimeError("FAST_JSON requires the orjson package")
+        super().__init__(app)
+
+    def _options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self._app.debug:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._options()).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def init_compression(app, min_size=COMPRESSION_MIN_SIZE):
+    """Comprime com br ou gzip (conforme Accept-Encoding) respostas a partir de `min_size` bytes."""
+    if min_size <= 0:
+        return
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    @app.after_request
+    def _compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add("Accept-Encoding")
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or "Content-Encoding" in response.headers):
+            return response
+        encoding = request.accept_encodings.best_match(encodings)
+        if not encoding:
+            return response
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        response.set_data(compress_body(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -1,64 +1,200 @@
 from firebase_admin import firestore
+from services.firebase_client import db
 from models.sales import Sales
 from pydantic import ValidationError
 from werkzeug.exceptions import NotFound, BadRequest
+from services.isbn_utils import sanitize_isbn
+from services.pagination import encode_page_token, decode_page_token
+from services.version_service import bump_version
+from services.counter_utils import increment_counter, read_counter, reset_counter
+from services.export_service import stream_documents
+from services.inventory_service import inventory_delta, apply_inventory_delta
+from services.stock_service import copy_summary_fields, load_copy_summaries, sharded_stock, record_stock_delta, schedule_stock_fold
+from services.book_cache import invalidate_books
+from services.users_service import fetch_sebo_member
+from services.model_adapters import ModelAdapter
+from collections import Counter
+from uuid import uuid4
 
 
-db = firestore.client()
+MAX_BASKET_SIZE = 100 # 2 escritas por item + contadores, abaixo do limite de 500 por transaction
+SALES_ADAPTER = ModelAdapter(Sales)
 
-def create_sale(user_id, sebo_id, ISBN, copy_id): 
-    
-    user_ref = db.collection('Users').document(user_id)
+def _seller_name(sebo_id, user_id, token_name):
+    # vendedor pelo diretorio do sebo (cache do worker) em vez de ler Users a cada venda;
+    # o nome do diretorio acompanha o update_user, o do token fica como reserva
+    member = fetch_sebo_member(sebo_id, user_id)
+    if member is None: # vendedor cadastrado depois do cache (ou por outro worker)
+        member = fetch_sebo_member(sebo_id, user_id, use_cache=False)
+    if member is None:
+        raise NotFound(f"User with ID {user_id} not found")
+    return member.get('name') or token_name or 'Unknown User'
+
+def create_sale(user_id, sebo_id, ISBN, copy_id, user_name=None): 
+    user_name = _seller_name(sebo_id, user_id, user_name)
     book_ref = db.collection('Sebos').document(sebo_id).collection('Books').document(ISBN)
     copy_ref = book_ref.collection('Copies').document(copy_id)
 
-    user_doc = user_ref.get(['name'])
-    book_doc = book_ref.get(['title', 'authors', 'categories', 'averageRating', 'ratingsCount'])
-    copy_doc = copy_ref.get(['price', 'conservationState'])
-
-
-    if not user_doc.exists:
-        raise NotFound(f"User with ID {user_id} not found")
-    if not book_doc.exists:
-        raise NotFound(f"Book with ISBN {ISBN} not found")
-    if not copy_doc.exists:
-        raise NotFound(f"Copy with ID {copy_id} not found for book {ISBN}")
-    
-    user_data = user_doc.to_dict()
-    book_data = book_doc.to_dict()
-    copy_data = copy_doc.to_dict()
-    
-    sale_data = {
-        "user_id": user_id,
-        "user_name": user_data.get('name', 'Unknown User'),
-        "ISBN": ISBN,
-        "book_title": book_data.get('title', 'Unknown'),
-        "authors": book_data.get('authors', ['Unknown']),
-        "book_category": book_data.get('categories', ['Unknown']),
-        "average_rating": book_data.get('averageRating', 0.0),
-        "ratings_count": book_data.get('ratingsCount', 0),
-        "book_price": copy_data.get('price', 0.0),
-        "conservation_state": copy_data.get('conservationState', 'Novo'),
-    }
-    try:
-        sale = Sales.model_validate(sale_data)
-    except ValidationError as e:
-        raise BadRequest(f"Invalid sale data: {e}")
     transaction = db.transaction()
     @firestore.transactional # transaction faz que essas operacoes sejam como se fosse uma
     # caso uma de erro não tera dado sendo modificado pela metade
-    def sale_transaction(transaction, book_ref, copy_ref, sebo_id, sale):
+    def sale_transaction(transaction):
+        # livro e copia numa unica chamada get_all; dentro da transaction a mesma copia
+        # nao pode ser vendida duas vezes e a lista de copias do livro e regravada sem corrida
+        snapshots = {doc.reference.path: doc for doc in transaction.get_all([book_ref, copy_ref])}
+        book_doc = snapshots[book_ref.path]
+        copy_doc = snapshots[copy_ref.path]
+
+        if not book_doc.exists:
+            raise NotFound(f"Book with ISBN {ISBN} not found")
+        if not copy_doc.exists:
+            raise NotFound(f"Copy with ID {copy_id} not found for book {ISBN}")
+        
+        book_data = book_doc.to_dict()
+        copy_data = copy_doc.to_dict()
+        
+        sale_data = {
+            "user_id": user_id,
+            "user_name": user_name,
+            "ISBN": ISBN,
+            "book_title": book_data.get('title', 'Unknown'),
+            "authors": book_data.get('authors', ['Unknown']),
+            "book_category": book_data.get('categories', ['Unknown']),
+            "average_rating": book_data.get('averageRating', 0.0),
+            "ratings_count": book_data.get('ratingsCount', 0),
+            "book_price": copy_data.get('price', 0.0),
+            "conservation_state": copy_data.get('conservationState', 'Novo'),
+        }
+        try:
+            sale = Sales.model_validate(sale_data)
+        except ValidationError as e:
+            raise BadRequest(f"Invalid sale data: {e}")
+        if sharded_stock(): # o livro so e lido; a venda sai num shard do estoque
+            record_stock_delta(transaction, book_ref, removed=[copy_id])
+        else: # leitura (livros antigos sem copySummaries) antes de qualquer escrita da transaction
+            summaries = [summary for summary in load_copy_summaries(book_ref, book_data, transaction)
+                         if summary.get('copyId') != copy_id]
+            transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(-1),
+                                          **copy_summary_fields(summaries)})
+
         sale_ref = db.collection('Sales').document(sebo_id).collection('saleId').document(sale.sale_id)
-        transaction.set(sale_ref, sale.model_dump(by_alias=True))
+        sale_dict = sale.model_dump(by_alias=True)
+        transaction.set(sale_ref, sale_dict)
         transaction.delete(copy_ref)
-        transaction.update(book_ref, {"totalQuantity": firestore.firestore.Increment(-1)})
+        _apply_stats_delta(transaction, sebo_id, _sale_stats_delta(added=[sale_dict]))
+        apply_inventory_delta(transaction, sebo_id, inventory_delta(removed=[(book_data.get('categories'), copy_data)]))
+        bump_version(transaction, sebo_id, "sales", "books")
+        return sale
     try:
-        sale_transaction(transaction, book_ref, copy_ref, sebo_id, sale)
+        sale = sale_transaction(transaction)
+        invalidate_books(sebo_id, [book_ref.id])
+        schedule_stock_fold([book_ref])
         return {"saleId": sale.sale_id, "data": sale.model_dump(by_alias=True)}
+    except (NotFound, BadRequest):
+        raise
     except Exception as e:
         raise BadRequest(f"Data was not modified: failed to create sale: {e}")
 
 
+def create_sale_batch(user_id, sebo_id, items, user_name=None):
+    if not isinstance(items, list) or not items:
+        raise BadRequest("Invalid basket: expected a non-empty list of items")
+    if len(items) > MAX_BASKET_SIZE:
+        raise BadRequest(f"Invalid basket: at most {MAX_BASKET_SIZE} items per sale")
+
+    pairs = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get('ISBN') or not item.get('copyId'):
+            raise BadRequest("Invalid basket: each item needs ISBN and copyId")
+        if not isinstance(item['ISBN'], str) or not isinstance(item['copyId'], str):
+            raise BadRequest("Invalid basket: ISBN and copyId must be strings")
+        pairs.append((sanitize_isbn(item['ISBN']), item['copyId']))
+    if len(set(pairs)) != len(pairs):
+        raise BadRequest("Invalid basket: duplicated copies")
+
+    user_name = _seller_name(sebo_id, user_id, user_name)
+    books_coll = db.collection('Sebos').document(sebo_id).collection('Books')
+    book_refs = {ISBN: books_coll.document(ISBN) for ISBN, _ in pairs}
+    copy_refs = [book_refs[ISBN].collection('Copies').document(copy_id) for ISBN, copy_id in pairs]
+    basket_id = str(uuid4())
+
+    transaction = db.transaction()
+    @firestore.transactional
+    def basket_transaction(transaction):
+        # uma unica chamada get_all para livros e copias
+        snapshots = {doc.reference.path: doc for doc in
+                     transaction.get_all([*book_refs.values(), *copy_refs])}
+
+        sale_rows = []
+        sold_copies = [] # (categorias, copia) que saem do resumo do estoque
+        remaining = {} # ISBN -> copias denormalizadas que continuam no livro
+        for (ISBN, copy_id), copy_ref in zip(pairs, copy_refs):
+            book_doc = snapshots[book_refs[ISBN].path]
+            copy_doc = snapshots[copy_ref.path]
+            if not book_doc.exists:
+                raise NotFound(f"Book with ISBN {ISBN} not found")
+            if not copy_doc.exists:
+                raise NotFound(f"Copy with ID {copy_id} not found for book {ISBN}")
+            book_data = book_doc.to_dict()
+            copy_data = copy_doc.to_dict()
+            sold_copies.append((book_data.get('categories'), copy_data))
+            if not sharded_stock():
+                if ISBN not in remaining:
+                    remaining[ISBN] = load_copy_summaries(book_refs[ISBN], book_data, transaction)
+                remaining[ISBN] = [summary for summary in remaining[ISBN] if summary.get('copyId') != copy_id]
+            sale_data = {
+                "user_id": user_id,
+                "user_name": user_name,
+                "ISBN": ISBN,
+                "book_title": book_data.get('title', 'Unknown'),
+                "authors": book_data.get('authors', ['Unknown']),
+                "book_category": book_data.get('categories', ['Unknown']),
+                "average_rating": book_data.get('averageRating', 0.0),
+                "ratings_count": book_data.get('ratingsCount', 0),
+                "book_price": copy_data.get('price', 0.0),
+                "conservation_state": copy_data.get('conservationState', 'Novo'),
+                "basket_id": basket_id,
+            }
+            sale_rows.append(sale_data)
+        try:
+            sale_dicts = SALES_ADAPTER.dump_many(SALES_ADAPTER.validate_many(sale_rows)) # cesta inteira numa chamada
+        except ValidationError as e:
+            raise BadRequest(f"Invalid sale data: {e}")
+
+        sales_coll = db.collection('Sales').document(sebo_id).collection('saleId')
+        for sale_dict, copy_ref in zip(sale_dicts, copy_refs):
+            transaction.set(sales_coll.document(sale_dict['saleId']), sale_dict)
+            transaction.delete(copy_ref)
+        if sharded_stock():
+            sold_ids = {}
+            for ISBN, copy_id in pairs:
+                sold_ids.setdefault(ISBN, []).append(copy_id)
+            for ISBN, copy_ids in sold_ids.items():
+                record_stock_delta(transaction, book_refs[ISBN], removed=copy_ids)
+        else:
+            for ISBN, sold in Counter(ISBN for ISBN, _ in pairs).items():
+                transaction.update(book_refs[ISBN], {"totalQuantity": firestore.firestore.Increment(-sold),
+                                                     **copy_summary_fields(remaining[ISBN])})
+        _apply_stats_delta(transaction, sebo_id, _sale_stats_delta(added=sale_dicts))
+        apply_inventory_delta(transaction, sebo_id, inventory_delta(removed=sold_copies))
+        bump_version(transaction, sebo_id, "sales", "books")
+        return sale_dicts
+    try:
+        sale_dicts = basket_transaction(transaction)
+        invalidate_books(sebo_id, book_refs)
+        schedule_stock_fold(book_refs.values())
+    except (NotFound, BadRequest):
+        raise
+    except Exception as e:
+        raise BadRequest(f"Data was not modified: failed to create sales: {e}")
+    return {
+        "basketId": basket_id,
+        "totalItems": len(sale_dicts),
+        "totalPrice": sum(sale['bookPrice'] for sale in sale_dicts),
+        "sales": sale_dicts,
+    }
+
+
 def fetch_sale(sale_id, sebo_id):
     sale_ref = db.collection('Sales').document(sebo_id).collection('saleId').document(sale_id)
     sale_doc = sale_ref.get()
@@ -66,25 +202,46 @@ def fetch_sale(sale_id, sebo_id):
         raise NotFound(f"Sale with ID {sale_id} not found")
     return sale_doc.to_dict()
 
-def delete_sale(sale_id, sebo_id):
+def delete_sale(sebo_id, sale_id):
     sale_ref = db.collection('Sales').document(sebo_id).collection('saleId').document(sale_id)
-    sale_doc = sale_ref.get()
-    if not sale_doc.exists:
-        raise NotFound(f"Sale with ID {sale_id} not found")
-    sale_ref.delete()
-    return sale_doc.to_dict()
+
+    transaction = db.transaction()
+    @firestore.transactional
+    def delete_sale_transaction(transaction, sale_ref):
+        sale_doc = sale_ref.get(transaction=transaction)
+        if not sale_doc.exists:
+            raise NotFound(f"Sale with ID {sale_id} not found")
+        sale_data = sale_doc.to_dict()
+        transaction.delete(sale_ref)
+        _apply_stats_delta(transaction, sebo_id, _sale_stats_delta(removed=[sale_data]))
+        bump_version(transaction, sebo_id, "sales")
+        return sale_data
+    try:
+        return delete_sale_transaction(transaction, sale_ref)
+    except NotFound:
+        raise
+    except Exception as e:
+        raise BadRequest(f"Data was not modified: failed to delete sale: {e}")
 
 def update_sale(sebo_id, sale_id, update_data):
     sale_ref = db.collection('Sales').document(sebo_id).collection('saleId').document(sale_id)
-    sale_doc = sale_ref.get()
-    if not sale_doc.exists:
-        raise NotFound(f"Sale with ID {sale_id} not found")
-    try:
+
+    transaction = db.transaction()
+    @firestore.transactional
+    def update_sale_transaction(transaction, sale_ref):
+        sale_doc = sale_ref.get(transaction=transaction)
+        if not sale_doc.exists:
+            raise NotFound(f"Sale with ID {sale_id} not found")
         sale_data = sale_doc.to_dict()
-        validated_sale = Sales.model_validate(sale_data)
-        updated_fields = validated_sale.model_copy(update=update_data)
-        sale_ref.update(updated_fields.model_dump(by_alias=True))
-        return updated_fields.model_dump(by_alias=True)    
+        updated_data = SALES_ADAPTER.merge_update(sale_data, update_data) # valida so os campos enviados
+        transaction.update(sale_ref, updated_data)
+        _apply_stats_delta(transaction, sebo_id, _sale_stats_delta(added=[updated_data], removed=[sale_data]))
+        bump_version(transaction, sebo_id, "sales")
+        return updated_data
+    try:
+        return update_sale_transaction(transaction, sale_ref)
+    except NotFound:
+        raise
     except (ValidationError, Exception) as e:
         raise BadRequest(f"Invalid sale data: {e}")
 
@@ -93,4 +250,99 @@ def fetch_all_sales(sebo_id):
     all_sales = []
     for sale in sales_ref.stream():
         all_sales.append(sale.to_dict())
-    return all_sales
\ No newline at end of file
+    return all_sales
+
+def fetch_sales_page(sebo_id, limit, start_after=None, date_from=None, date_to=None,
+                     seller_id=None, category=None):
+    query = db.collection('Sales').document(sebo_id).collection('saleId')
+    if seller_id:
+        query = query.where('userId', '==', seller_id)
+    if category:
+        query = query.where('bookCategory', 'array_contains', category)
+    if date_from:
+        query = query.where('saleDate', '>=', date_from)
+    if date_to:
+        query = query.where('saleDate', '<', date_to)
+    query = query.order_by('saleDate', direction=firestore.Query.DESCENDING).order_by(
+        '__name__', direction=firestore.Query.DESCENDING)
+
+    cursor = decode_page_token(start_after)
+    if cursor:
+        if set(cursor) != {'saleDate', '__name__'}:
+            raise BadRequest("startAfter token does not match the requested filters")
+        query = query.start_after(cursor)
+
+    sale_docs = list(query.limit(limit + 1).stream())
+    has_more = len(sale_docs) > limit
+    sale_docs = sale_docs[:limit]
+
+    next_token = None
+    if has_more:
+        last = sale_docs[-1]
+        next_token = encode_page_token({'saleDate': last.get('saleDate'), '__name__': last.id})
+    return {"sales": [sale_doc.to_dict() for sale_doc in sale_docs], "nextPageToken": next_token}
+
+# ============================================
+#           Estatisticas agregadas
+# ============================================
+# Sebos/{seboId}/Stats/sales guarda contadores mantidos nas mesmas transactions
+# que criam/alteram/removem vendas, distribuidos em shards (counter_utils); o dashboard
+# le so o contador. Vendas anteriores aos contadores precisam de um rebuild-stats.
+
+STATS_GROUPS = ('daily', 'monthly', 'byCategory', 'byConservationState', 'bySeller')
+
+
+def _sales_stats_ref(sebo_id):
+    return db.collection('Sebos').document(sebo_id).collection('Stats').document('sales')
+
+
+def _sale_buckets(sale_data):
+    sale_date = sale_data.get('saleDate') or ''
+    buckets = [('daily', sale_date[:10]), ('monthly', sale_date[:7])]
+    buckets += [('byCategory', category) for category in sale_data.get('bookCategory') or []]
+    buckets.append(('byConservationState', sale_data.get('conservationState')))
+    buckets.append(('bySeller', sale_data.get('userId')))
+    return [(group, key) for group, key in buckets if key]
+
+
+def _sale_stats_delta(added=(), removed=()):
+    delta = {"totalRevenue": 0.0, "totalUnits": 0}
+    for sign, sales in ((1, added), (-1, removed)):
+        for sale_data in sales:
+            price = float(sale_data.get('bookPrice') or 0.0) * sign
+            delta['totalRevenue'] += price
+            delta['totalUnits'] += sign
+            for group, key in _sale_buckets(sale_data):
+                bucket = delta.setdefault(group, {}).setdefault(key, {"revenue": 0.0, "units": 0})
+                bucket['revenue'] += price
+                bucket['units'] += sign
+    for sale_data in added: # nome do vendedor acompanha a venda mais recente
+        seller_id = sale_data.get('userId')
+        if seller_id and sale_data.get('userName'):
+            delta['bySeller'][seller_id]['name'] = sale_data['userName']
+    return delta
+
+
+def _apply_stats_delta(writer, sebo_id, delta):
+    increment_counter(writer, _sales_stats_ref(sebo_id), delta)
+
+
+def rebuild_sales_stats(sebo_id):
+    """Recalcula os contadores a partir das vendas, em paginas e fora de transaction (comando rebuild-stats)."""
+    sales_query = db.collection('Sales').document(sebo_id).collection('saleId')
+    stats = _sale_stats_delta(added=list(stream_documents(sales_query)))
+    for group in STATS_GROUPS:
+        stats.setdefault(group, {})
+    reset_counter(_sales_stats_ref(sebo_id), stats)
+    return stats
+
+
+def fetch_sales_stats(sebo_id):
+    stats = read_counter(_sales_stats_ref(sebo_id)) or {}
+    stats.pop('initialized', None) # contadores gravados antes dos shards
+    stats = dict({"totalRevenue": 0.0, "totalUnits": 0}, **stats)
+    for group in STATS_GROUPS:
+        stats.setdefault(group, {})
+    total_units = stats.get('totalUnits', 0)
+    stats['averagePrice'] = stats.get('totalRevenue', 0.0) / total_units if total_units else 0.0
+    return stats
@@ -0,0 +1,169 @@
+from firebase_admin import firestore
+from services.firebase_client import db
+from werkzeug.exceptions import BadRequest
+from services.isbn_utils import sanitize_isbn
+from services.export_service import stream_snapshots
+import os
+import re
+import unicodedata
+import zlib
+
+
+# Sebos/{seboId}/SearchIndex/{token}.{bucket} -> {"postings": {ISBN: peso}}
+# Mantido junto com as escritas de livro (set(merge=True) so em postings.<ISBN>); a busca
+# le so os documentos dos tokens pesquisados e depois os livros mais bem ranqueados.
+# As postings de cada token ficam divididas em SEARCH_INDEX_BUCKETS documentos pelo ISBN,
+# para tokens frequentes (prefixos curtos, palavras comuns) nao passarem de 1 MiB.
+SEARCH_INDEX_BUCKETS = int(os.getenv("SEARCH_INDEX_BUCKETS", "4"))
+FIELD_WEIGHTS = {"title": 4.0, "authors": 3.0, "categories": 2.0, "publisher": 1.0}
+PREFIX_FIELDS = ("title", "authors") # busca enquanto digita nesses campos
+MIN_PREFIX_LENGTH = 3
+MIN_ISBN_PREFIX_LENGTH = 6 # prefixos menores (978, 9788...) sao comuns a quase todo o acervo
+ISBN_WEIGHT = 10.0
+META_DOC = "_meta"
+MAX_QUERY_TOKENS = 8
+STOPWORDS = {
+    "a", "o", "as", "os", "e", "de", "da", "do", "das", "dos", "em", "no", "na", "nos", "nas",
+    "um", "uma", "para", "por", "com", "the", "of", "and", "an", "in", "on", "to", "for",
+}
+
+
+def normalize_text(text):
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return without_accents.lower()
+
+
+def tokenize(text):
+    return [word for word in re.split(r"[^a-z0-9]+", normalize_text(text)) if word and word not in STOPWORDS]
+
+
+def book_tokens(book_data):
+    """Return {token: weight} for a stored book document (camelCase keys)."""
+    tokens = {}
+
+    def add(token, weight):
+        if weight > tokens.get(token, 0):
+            tokens[token] = weight
+
+    for field, weight in FIELD_WEIGHTS.items():
+        values = book_data.get(field) or []
+        if isinstance(values, str):
+            values = [values]
+        for value in values:
+            for word in tokenize(value):
+                add(word, weight)
+                if field in PREFIX_FIELDS:
+                    for length in range(MIN_PREFIX_LENGTH, len(word)):
+                        add(word[:length], weight / 2)
+
+    ISBN = sanitize_isbn(book_data.get("isbn") or book_data.get("ISBN") or "").lower()
+    for length in range(MIN_ISBN_PREFIX_LENGTH, len(ISBN) + 1):
+        add(ISBN[:length], ISBN_WEIGHT)
+    return tokens
+
+
+def _index_ref(sebo_id):
+    return db.collection('Sebos').document(sebo_id).collection('SearchIndex')
+
+
+def _token_id(token, bucket):
+    return f"{token}.{bucket}"
+
+
+def _bucket(ISBN):
+    return zlib.crc32(ISBN.encode("utf-8")) % SEARCH_INDEX_BUCKETS
+
+
+def index_book(writer, sebo_id, book_data):
+    """Adiciona as postings do livro; `writer` pode ser uma transaction ou um batch."""
+    ISBN = sanitize_isbn(book_data.get("isbn") or book_data.get("ISBN"))
+    index_ref = _index_ref(sebo_id)
+    bucket = _bucket(ISBN)
+    for token, weight in book_tokens(book_data).items():
+        writer.set(index_ref.document(_token_id(token, bucket)), {"postings": {ISBN: weight}}, merge=True)
+
+
+def unindex_book(writer, sebo_id, book_data):
+    ISBN = sanitize_isbn(book_data.get("isbn") or book_data.get("ISBN"))
+    index_ref = _index_ref(sebo_id)
+    bucket = _bucket(ISBN)
+    for token in book_tokens(book_data):
+        writer.set(index_ref.document(_token_id(token, bucket)), {"postings": {ISBN: firestore.DELETE_FIELD}}, merge=True)
+
+
+def index_operation_count(book_data):
+    return len(book_tokens(book_data))
+
+
+def rebuild_search_index(sebo_id):
+    """Indexa todos os livros do sebo fora das requisicoes (comando rebuild-search-index).
+
+    Le os livros em paginas e grava as postings com merge, sem sobrescrever as das escritas
+    concorrentes. Se o indice tem outra divisao em buckets (ou e anterior a ela), os
+    documentos antigos sao apagados antes, e a busca fica incompleta ate o fim do comando.
+    """
+    index_ref = _index_ref(sebo_id)
+    meta_doc = index_ref.document(META_DOC).get()
+    batch, pending = db.batch(), 0
+    def reserve(operations):
+        nonlocal batch, pending
+        if pending + operations > 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+        pending += operations
+
+    if (meta_doc.to_dict() or {}).get("buckets") != SEARCH_INDEX_BUCKETS:
+        for token_doc in stream_snapshots(index_ref.select([])):
+            if token_doc.id == META_DOC:
+                continue
+            reserve(1)
+            batch.delete(token_doc.reference)
+
+    books_query = db.collection('Sebos').document(sebo_id).collection('Books').select(['isbn', *FIELD_WEIGHTS])
+    indexed = 0
+    for book_doc in stream_snapshots(books_query):
+        book_data = book_doc.to_dict()
+        book_data.setdefault('isbn', book_doc.id)
+        reserve(index_operation_count(book_data))
+        index_book(batch, sebo_id, book_data)
+        indexed += 1
+    reserve(1)
+    batch.set(index_ref.document(META_DOC), {"indexedBooks": indexed, "buckets": SEARCH_INDEX_BUCKETS})
+    batch.commit()
+    return indexed
+
+
+def search_books(sebo_id, query, limit=20):
+    query_tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    digits = sanitize_isbn(query).lower()
+    if len(digits) >= MIN_ISBN_PREFIX_LENGTH and len(digits) == len(re.sub(r"[\s-]", "", query)):
+        query_tokens = [digits[:13]] # consulta so com numeros/hifens: prefixo de ISBN
+    if not query_tokens:
+        raise BadRequest("Search query must contain at least one word")
+
+    index_ref = _index_ref(sebo_id)
+    token_refs = [index_ref.document(_token_id(token, bucket))
+                  for token in query_tokens for bucket in range(SEARCH_INDEX_BUCKETS)]
+    token_postings = {token: {} for token in query_tokens}
+    for token_doc in db.get_all(token_refs):
+        if token_doc.exists:
+            token_postings[token_doc.id.rsplit(".", 1)[0]].update((token_doc.to_dict() or {}).get("postings", {}))
+
+    scores = None
+    for token in query_tokens:
+        postings = token_postings[token]
+        if scores is None:
+            scores = dict(postings)
+        else: # todas as palavras precisam bater
+            scores = {ISBN: score + postings[ISBN] for ISBN, score in scores.items() if ISBN in postings}
+        if not scores:
+            return {"query": query, "total": 0, "results": []}
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    books_coll = db.collection('Sebos').document(sebo_id).collection('Books')
+    book_docs = db.get_all([books_coll.document(ISBN) for ISBN, _ in ranked],
+                           field_paths=['title', 'authors', 'categories', 'totalQuantity', 'isbn', 'thumbnail'])
+    books = {book_doc.id: book_doc.to_dict() for book_doc in book_docs if book_doc.exists}
+    results = [dict(books[ISBN], score=score) for ISBN, score in ranked if ISBN in books]
+    return {"query": query, "total": len(scores), "results": results}
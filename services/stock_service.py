@@ -0,0 +1,198 @@
+from firebase_admin import firestore
+from services.firebase_client import db
+from services.version_service import bump_version
+import atexit
+import logging
+import os
+import random
+import threading
+
+
+# Books/{ISBN}.copySummaries repete os campos de cada copia (a subcolecao Copies continua
+# sendo gravada) para que detalhe e listagem saiam de uma leitura do documento do livro.
+#
+# Com STOCK_SHARDS > 0 as escritas de copia (cadastro, exclusao, venda) nao regravam o
+# documento do livro: cada uma soma num dos shards Books/{ISBN}/StockShards/{n}, sorteado,
+#   {count: Increment(+-n), added: ArrayUnion(resumos), removed: ArrayUnion(copyIds)}
+# so com transforms, sem ler o shard. O detalhe do livro junta os shards na leitura; uma
+# thread por worker dobra os shards de volta em totalQuantity/copySummaries a cada
+# STOCK_FOLD_INTERVAL segundos. Ate la listagem, filtros e busca usam os valores dobrados.
+STOCK_SHARDS = int(os.getenv("STOCK_SHARDS", "0")) # 0 desliga
+STOCK_FOLD_INTERVAL = float(os.getenv("STOCK_FOLD_INTERVAL", "5"))
+COPY_SUMMARY_FIELDS = ('copyId', 'price', 'conservationState', 'registeredAt')
+
+logger = logging.getLogger(__name__)
+
+
+def copy_summary(copy_data):
+    return {field: copy_data.get(field) for field in COPY_SUMMARY_FIELDS}
+
+
+def copy_summary_fields(summaries):
+    """Campos denormalizados do livro: a lista de copias e o preco minimo, maximo e medio."""
+    prices = [summary['price'] for summary in summaries if summary.get('price') is not None]
+    return {
+        "copySummaries": summaries,
+        "minPrice": min(prices) if prices else None,
+        "maxPrice": max(prices) if prices else None,
+        "avgPrice": round(sum(prices) / len(prices), 2) if prices else None,
+    }
+
+
+def load_copy_summaries(book_ref, book_data, transaction=None):
+    # livros gravados antes da denormalizacao montam a lista uma vez a partir da subcolecao
+    summaries = (book_data or {}).get('copySummaries')
+    if summaries is None:
+        summaries = [copy_summary(copy.to_dict()) for copy in book_ref.collection('Copies').stream(transaction=transaction)]
+    return list(summaries)
+
+
+def sharded_stock():
+    return STOCK_SHARDS > 0
+
+
+def _shards_ref(book_ref):
+    return book_ref.collection('StockShards')
+
+
+def stock_shard_write(book_ref, added=(), removed=()):
+    """(ref, payload) do set(merge=True) num shard sorteado: `added` sao resumos, `removed` copyIds."""
+    payload = {"count": firestore.firestore.Increment(len(added) - len(removed))}
+    if added:
+        payload["added"] = firestore.firestore.ArrayUnion(list(added))
+    if removed:
+        payload["removed"] = firestore.firestore.ArrayUnion(list(removed))
+    return _shards_ref(book_ref).document(str(random.randrange(STOCK_SHARDS))), payload
+
+
+def record_stock_delta(writer, book_ref, added=(), removed=()):
+    """Soma a variacao do estoque num shard; `writer` pode ser uma transaction ou um batch."""
+    shard_ref, payload = stock_shard_write(book_ref, added, removed)
+    writer.set(shard_ref, payload, merge=True)
+
+
+def merge_stock_shards(book_ref, book_data, shard_docs, transaction=None):
+    """totalQuantity e campos de copias do livro somando os shards pendentes."""
+    summaries = {summary['copyId']: summary for summary in load_copy_summaries(book_ref, book_data, transaction)}
+    total = (book_data or {}).get('totalQuantity', 0)
+    removed = set()
+    for shard in shard_docs:
+        shard_data = shard.to_dict() or {}
+        total += shard_data.get('count', 0)
+        for summary in shard_data.get('added', []):
+            summaries[summary['copyId']] = summary
+        removed.update(shard_data.get('removed', []))
+    stock = copy_summary_fields([summary for copy_id, summary in summaries.items() if copy_id not in removed])
+    stock['totalQuantity'] = total
+    return stock
+
+
+def fetch_stock_shards(book_ref, transaction=None):
+    return list(_shards_ref(book_ref).stream(transaction=transaction))
+
+
+def delete_stock_shards(writer, shard_docs):
+    for shard in shard_docs:
+        writer.delete(shard.reference)
+
+
+def fold_stock(book_ref):
+    """Dobra os shards no documento do livro e apaga os shards; devolve quantos havia."""
+    transaction = db.transaction()
+    @firestore.transactional
+    def fold_transaction(transaction):
+        book_doc = book_ref.get(transaction=transaction)
+        shard_docs = fetch_stock_shards(book_ref, transaction)
+        if not shard_docs:
+            return 0
+        if book_doc.exists: # livro apagado: so sobram os shards para limpar
+            transaction.update(book_ref, merge_stock_shards(book_ref, book_doc.to_dict(), shard_docs, transaction))
+            # listagens leem o total dobrado: o ETag tem que mudar junto
+            bump_version(transaction, book_ref.parent.parent.id, "books")
+        delete_stock_shards(transaction, shard_docs)
+        return len(shard_docs)
+    return fold_transaction(transaction)
+
+
+class _StockFolder:
+    """Livros com shards pendentes neste worker, dobrados por uma unica thread em segundo plano."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {} # path do livro -> ref
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.stats = {"scheduled": 0, "folded": 0, "failed": 0}
+
+    def _ensure_started(self):
+        # como a fila dos logs de auditoria: a thread so nasce no primeiro uso, ja no worker
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._wake.clear()
+                self._thread = threading.Thread(target=self._run, name="stock-folder", daemon=True)
+                self._thread.start()
+
+    def schedule(self, book_refs):
+        self._ensure_started()
+        with self._lock:
+            for book_ref in book_refs:
+                self._pending[book_ref.path] = book_ref
+            self.stats["scheduled"] += len(book_refs)
+
+    def fold_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for path, book_ref in pending.items():
+            try:
+                fold_stock(book_ref)
+                with self._lock:
+                    self.stats["folded"] += 1
+            except Exception as e:
+                logger.warning(f"Stock fold failed for {path}: {e}")
+                with self._lock:
+                    self.stats["failed"] += 1
+                    if not self._stopping.is_set():
+                        self._pending.setdefault(path, book_ref) # tenta de novo na proxima rodada
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self.fold_pending()
+
+    def flush(self, timeout=10.0):
+        """Dobra o que estiver pendente e encerra a thread; usado no desligamento do worker."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+        stats["shards"] = STOCK_SHARDS
+        return stats
+
+
+_folder = _StockFolder(STOCK_FOLD_INTERVAL)
+atexit.register(_folder.flush)
+
+
+def schedule_stock_fold(book_refs):
+    """Agenda a dobra dos shards dos livros; chamar depois do commit da escrita."""
+    if sharded_stock():
+        _folder.schedule(list(book_refs))
+
+
+def flush_stock_folds(timeout=10.0):
+    _folder.flush(timeout)
+
+
+def stock_folder_stats():
+    return _folder.snapshot()
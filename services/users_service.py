@@ -1,13 +1,78 @@
 from firebase_admin import firestore, auth
+from services.firebase_client import db
 from models.users import User, UpdateUser
 from models.sebos import Sebo
 from pydantic import ValidationError 
 from werkzeug.exceptions import NotFound, Conflict, BadRequest, Forbidden
+from services.version_service import bump_version
+from services.cache_utils import TTLCache
+from services.model_adapters import ModelAdapter
+import os
 import secrets
 import string
 
 
-db = firestore.client()
+# Sebos/{seboId}/Directory/members guarda userId -> {name, userRole, email} de todos os usuarios
+# do sebo, atualizado no mesmo batch de save_user, add_new_employee, update_user e delete_user.
+# Listagem e checagens de membro leem esse documento em vez de consultar a colecao Users.
+MEMBER_FIELDS = ('name', 'userRole', 'email')
+MEMBERS_CACHE_SIZE = int(os.getenv("MEMBERS_CACHE_SIZE", "1024"))
+MEMBERS_CACHE_TTL = float(os.getenv("MEMBERS_CACHE_TTL", "60"))
+
+_members_cache = TTLCache(maxsize=MEMBERS_CACHE_SIZE, ttl=MEMBERS_CACHE_TTL)
+USER_ADAPTER = ModelAdapter(User)
+
+
+def _directory_ref(sebo_id):
+    return db.collection('Sebos').document(sebo_id).collection('Directory').document('members')
+
+def _member_entry(user_data):
+    return {field: user_data.get(field) for field in MEMBER_FIELDS}
+
+def _set_member(writer, sebo_id, user_id, user_data):
+    writer.set(_directory_ref(sebo_id), {"members": {user_id: _member_entry(user_data)}}, merge=True)
+
+def _remove_member(writer, sebo_id, user_id):
+    writer.set(_directory_ref(sebo_id), {"members": {user_id: firestore.firestore.DELETE_FIELD}}, merge=True)
+
+def rebuild_sebo_members(sebo_id):
+    # monta o diretorio a partir da colecao Users dentro da transaction, como o rebuild do estoque
+    directory_ref = _directory_ref(sebo_id)
+    users_query = db.collection('Users').select(['userId', *MEMBER_FIELDS]).where('seboId', '==', sebo_id)
+
+    transaction = db.transaction()
+    @firestore.transactional
+    def rebuild_transaction(transaction):
+        directory_ref.get(transaction=transaction)
+        members = {user.id: _member_entry(user.to_dict()) for user in users_query.stream(transaction=transaction)}
+        transaction.set(directory_ref, {"members": members, "initialized": True})
+        return members
+    return rebuild_transaction(transaction)
+
+def list_sebo_ids():
+    # usado pelos comandos de manutencao (flask --app app ...) que rodam para todos os sebos
+    return [sebo_ref.id for sebo_ref in db.collection('Sebos').list_documents()]
+
+def fetch_sebo_members(sebo_id, use_cache=True):
+    """userId -> {name, userRole, email} dos usuarios do sebo, com no maximo uma leitura.
+
+    O cache e por worker e so e limpo pelas escritas do proprio worker; quem precisa do
+    valor atual (listagem com ETag, exclusao de usuarios) passa use_cache=False.
+    """
+    members = _members_cache.get(sebo_id) if use_cache else None
+    if members is None:
+        directory_doc = _directory_ref(sebo_id).get()
+        directory = directory_doc.to_dict() if directory_doc.exists else None
+        if not directory or not directory.get('initialized'): # sebo anterior ao diretorio
+            members = rebuild_sebo_members(sebo_id)
+        else:
+            members = directory.get('members', {})
+        _members_cache.set(sebo_id, members)
+    return members
+
+def fetch_sebo_member(sebo_id, user_id, use_cache=True):
+    return fetch_sebo_members(sebo_id, use_cache).get(user_id)
+
 
 def save_user(user_id, email, name, user_data): 
     user_data['user_id'] = user_id
@@ -48,8 +113,14 @@ def save_user(user_id, email, name, user_data):
         auth.set_custom_user_claims(user.user_id, claims)
     except Exception as e:
         raise BadRequest(f"Failed to set custom claims for user {user.user_id}: {e}")
-    user_ref.set(user.model_dump(by_alias=True))
-    return user.model_dump(by_alias=True)
+    user_dump = user.model_dump(by_alias=True)
+    batch = db.batch()
+    batch.set(user_ref, user_dump)
+    _set_member(batch, user.sebo_id, user.user_id, user_dump)
+    bump_version(batch, user.sebo_id, "users")
+    batch.commit()
+    _members_cache.pop(user.sebo_id)
+    return user_dump
 
 def fetch_user(user_id):
     user_ref = db.collection('Users').document(user_id)
@@ -114,7 +185,12 @@ def add_new_employee(admin_user_id, sebo_id, employee_data):  # aqui o admin e o
         raise BadRequest(f"Failed to set custom claims for employee user {employee_uid}: {e}")
     user_ref = db.collection('Users').document(employee_uid)
     employee_info = employee_user.model_dump(by_alias=True)
-    user_ref.set(employee_info)
+    batch = db.batch()
+    batch.set(user_ref, employee_info)
+    _set_member(batch, sebo_id, employee_uid, employee_info)
+    bump_version(batch, sebo_id, "users")
+    batch.commit()
+    _members_cache.pop(sebo_id)
     return {
         "employee_user": employee_info,
         "temporary_password": firebase_user['temporary_password'],
@@ -127,23 +203,28 @@ def update_user(user_id, update_data):
     if not user_doc.exists:
         raise NotFound(f"User with ID {user_id} not found")
     try:
-        user_data = user_doc.to_dict()
-        validated_user = User.model_validate(user_data)
         validated_updates = UpdateUser.model_validate(update_data)
-        updated_fields = validated_user.model_copy(update=validated_updates.model_dump(exclude_unset=True))
+        # o documento gravado ja passou pelo User: so os campos enviados sao validados
+        user_dump = USER_ADAPTER.merge_update(user_doc.to_dict(), validated_updates.model_dump(exclude_unset=True))
+        sebo_id = user_dump['seboId']
 
         if validated_updates.user_role is not None:
             try:
                 claims = {
-                    "seboId": updated_fields.sebo_id,
-                    "userRole": updated_fields.user_role.value
+                    "seboId": sebo_id,
+                    "userRole": validated_updates.user_role.value
                 }
                 auth.set_custom_user_claims(user_id, claims)
             except Exception as e:
                 raise BadRequest(f"Failed to update custom claims for user {user_id}: {e}")
         
-        user_ref.update(updated_fields.model_dump(by_alias=True))
-        return updated_fields.model_dump(by_alias=True)
+        batch = db.batch()
+        batch.update(user_ref, user_dump)
+        _set_member(batch, sebo_id, user_id, user_dump)
+        bump_version(batch, sebo_id, "users")
+        batch.commit()
+        _members_cache.pop(sebo_id)
+        return user_dump
     except ValidationError as e:
         raise BadRequest(f"Invalid user data: {e}")
 
@@ -154,22 +235,25 @@ def delete_user(user_id, sebo_id):
     user_doc = user_ref.get()
     if not user_doc.exists:
         raise NotFound(f"User with ID {user_id} not found")
-    user_data = user_doc.to_dict()
-    try:
-        validated_user = User.model_validate(user_data)
-    except ValidationError as e:
-        raise BadRequest(f"User data in database is invalid: {e}")
-    if validated_user.sebo_id != sebo_id:
+    user_dump = USER_ADAPTER.project(user_doc.to_dict())
+    if user_dump is None:
+        raise BadRequest("User data in database is invalid: missing required fields")
+    if user_dump['seboId'] != sebo_id:
         raise Forbidden("You can only delete users from your own sebo.")
     try:
-        user_ref.delete()
+        batch = db.batch()
+        batch.delete(user_ref)
+        _remove_member(batch, sebo_id, user_id)
+        bump_version(batch, sebo_id, "users")
+        batch.commit()
+        _members_cache.pop(sebo_id)
         auth.delete_user(user_id)
     except Exception as e:
         raise BadRequest(f"Failed to delete user {user_id}: {e}")
-    return validated_user.model_dump(by_alias=True)
+    return user_dump
 
 def fetch_all_sebo_users(sebo_id): 
-    users_ref = db.collection('Users').select(['userId', 'email', 'name', 'userRole'])
-    query = users_ref.where('seboId', '==', sebo_id)
-    users = [user.to_dict() for user in query.stream()]
-    return users
\ No newline at end of file
+    # uma leitura do diretorio em vez de uma por usuario; sem cache para nao servir uma lista
+    # antiga com o ETag novo de uma escrita feita em outro worker
+    members = fetch_sebo_members(sebo_id, use_cache=False)
+    return [{"userId": user_id, **member} for user_id, member in sorted(members.items())]
\ No newline at end of file
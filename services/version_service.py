@@ -0,0 +1,59 @@
+from flask import g, request, current_app, make_response
+from services.firebase_client import db
+from services.counter_utils import increment_counter, read_counter
+from functools import wraps
+import hashlib
+
+
+# Sebos/{seboId}/Versions/{colecao} -> {"version": n}
+# Um contador por colecao listada: toda escrita em livros, vendas, usuarios ou logs
+# incrementa o contador no mesmo commit, e os GETs de listagem respondem 304 lendo so ele.
+# O contador e distribuido em shards (counter_utils): a versao e a soma, que so cresce.
+VERSIONED_COLLECTIONS = ("books", "sales", "users", "logs")
+
+
+def _version_ref(sebo_id, collection):
+    return db.collection('Sebos').document(sebo_id).collection('Versions').document(collection)
+
+
+def bump_version(writer, sebo_id, *collections):
+    """Incrementa as versoes; `writer` pode ser uma transaction ou um batch."""
+    for collection in collections:
+        if collection not in VERSIONED_COLLECTIONS:
+            raise ValueError(f"Unknown versioned collection: {collection}")
+        increment_counter(writer, _version_ref(sebo_id, collection), {"version": 1})
+
+
+def fetch_version(sebo_id, collection):
+    return (read_counter(_version_ref(sebo_id, collection), field_paths=['version']) or {}).get('version', 0)
+
+
+def make_etag(sebo_id, collection, version, query_string=b""):
+    raw = f"{sebo_id}:{collection}:{version}:".encode("utf-8") + query_string
+    return f"{collection}-{version}-{hashlib.sha1(raw).hexdigest()[:16]}"
+
+
+def conditional_get(collection):
+    """ETag baseado na versao da colecao; If-None-Match igual responde 304 sem ler a colecao.
+
+    A versao e lida antes dos dados: se uma escrita acontecer no meio, o corpo pode ser
+    mais novo que o ETag, o que so causa um download a mais na proxima consulta.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            version = fetch_version(g.sebo_id, collection)
+            etag = make_etag(g.sebo_id, collection, version, request.query_string)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True # o navegador guarda, mas sempre revalida
+            response.vary.add("Authorization")
+            return response
+        return wrapper
+    return decorator